@@ -0,0 +1,71 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from types import TracebackType
+
+
+class FixtureServer:
+    """
+    Serves a map of paths to HTML over HTTP on localhost, in a background
+    thread, so the crawler can be run without touching the live site
+
+    Use as a context manager:
+    ```
+    with FixtureServer() as server:
+        server.pages.update(generate_site(server.base_url, 100))
+        ...
+    ```
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0) -> None:
+        """
+        Parameters
+        ----------
+        host : str, default="127.0.0.1"
+            The host to bind to
+        port : int, default=0
+            The port to bind to. The default of 0 picks any free port
+        """
+        self.pages: dict[str, str] = {}
+
+        pages = self.pages
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                html = pages.get(self.path)
+                if html is None:
+                    self.send_error(404)
+                    return
+
+                body = html.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                # Keep benchmark output clean
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        """The URL the server is reachable at (without a trailing slash)"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FixtureServer":
+        self.thread.start()
+        return self
+
+    def __exit__(
+                self,
+                exc_type: type[BaseException] | None,
+                exc: BaseException | None,
+                traceback: TracebackType | None
+            ) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
@@ -0,0 +1,468 @@
+from contextlib import contextmanager
+from copy import deepcopy
+from itertools import count, islice
+from tempfile import TemporaryDirectory
+from typing import Any, Iterator
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from search_engine.database import DBCon
+from search_engine.lsa import LatentSemanticIndex
+from search_engine.spelling import SpellingIndex
+from search_engine.vocabulary import Vocabulary
+
+
+def _matches_condition(
+            document: dict[str, Any],
+            key: str,
+            condition: Any
+        ) -> bool:
+    """
+    Whether or not a field of a document matches a condition of a (simple)
+    MongoDB query: either a value to be equal to, or a `$gte` or `$not`
+    operator
+
+    Parameters
+    ----------
+    document : dict[str, Any]
+        The document to check
+    key : str
+        The (top-level) field to check
+    condition : Any
+        The condition the field must match
+
+    Returns
+    -------
+    bool
+        Whether or not the field matches the condition
+    """
+    if isinstance(condition, dict) and "$not" in condition:
+        return not _matches_condition(document, key, condition["$not"])
+    if isinstance(condition, dict) and "$gte" in condition:
+        return key in document and document[key] >= condition["$gte"]
+
+    return key in document and document[key] == condition
+
+
+def _matches(document: dict[str, Any], query: dict[str, Any]) -> bool:
+    """
+    Whether or not a document matches a (simple) MongoDB query. Only
+    conditions on top-level fields are supported (see `_matches_condition`)
+
+    Parameters
+    ----------
+    document : dict[str, Any]
+        The document to check
+    query : dict[str, Any]
+        The query to check the document against
+
+    Returns
+    -------
+    bool
+        Whether or not every field of the query matches the document
+    """
+    return all(
+        _matches_condition(document, key, condition)
+        for key, condition in query.items()
+    )
+
+
+def _is_operator(condition: Any) -> bool:
+    """
+    Whether or not a condition of a query is an operator (e.g. `$gte`)
+    rather than a value to be equal to
+
+    Parameters
+    ----------
+    condition : Any
+        The condition
+
+    Returns
+    -------
+    bool
+        Whether or not the condition is an operator
+    """
+    return isinstance(condition, dict) and any(
+        key.startswith("$") for key in condition
+    )
+
+
+class LocalCursor:
+    """An in-memory stand-in for a pymongo Cursor"""
+
+    def __init__(self, documents: Iterator[dict[str, Any]]) -> None:
+        self.documents = documents
+        self.max_documents: int | None = None
+
+    def limit(self, limit: int) -> "LocalCursor":
+        """
+        Limits the number of documents the cursor yields
+
+        Parameters
+        ----------
+        limit : int
+            The maximum number of documents to yield (0 means no limit)
+        """
+        self.max_documents = limit or None
+        return self
+
+    def __iter__(self) -> Iterator[dict[str, Any]]:
+        return islice(self.documents, self.max_documents)
+
+
+class LocalCollection:
+    """
+    An in-memory stand-in for a pymongo Collection, implementing only what
+    DBCon uses. Like MongoDB, lookups scan the collection unless an index was
+    created on the field being looked up
+    """
+
+    _ids = count()
+
+    def __init__(self) -> None:
+        self.documents: list[dict[str, Any]] = []
+        # Field -> value -> documents with that value
+        self.indexes: dict[str, dict[Any, list[dict[str, Any]]]] = {}
+
+    def _candidates(self, query: dict[str, Any]) -> list[dict[str, Any]]:
+        """
+        Narrows down the documents to check using an index, if any of the
+        queried fields has one
+
+        Parameters
+        ----------
+        query : dict[str, Any]
+            The query to find candidates for
+
+        Returns
+        -------
+        list[dict[str, Any]]
+            The documents that may match the query
+        """
+        for key, value in query.items():
+            if key in self.indexes and not _is_operator(value):
+                return self.indexes[key].get(value, [])
+        return self.documents
+
+    def create_index(self, key: str, **kwargs) -> str:
+        """
+        Creates an index on a top-level field
+
+        Parameters
+        ----------
+        key : str
+            The field to index
+
+        Returns
+        -------
+        str
+            The name of the index
+        """
+        index: dict[Any, list[dict[str, Any]]] = {}
+        for document in self.documents:
+            index.setdefault(document.get(key), []).append(document)
+        self.indexes[key] = index
+
+        return f"{key}_1"
+
+    def insert_one(self, document: dict[str, Any]) -> None:
+        """
+        Inserts a (copy of a) document
+
+        Parameters
+        ----------
+        document : dict[str, Any]
+            The document to insert
+        """
+        document = deepcopy(document)
+        document.setdefault("_id", next(LocalCollection._ids))
+        self.documents.append(document)
+
+        for key, index in self.indexes.items():
+            index.setdefault(document.get(key), []).append(document)
+
+    def insert_many(self, documents: list[dict[str, Any]], **kwargs) -> None:
+        """
+        Inserts (copies of) many documents
+
+        Parameters
+        ----------
+        documents : list[dict[str, Any]]
+            The documents to insert
+        """
+        for document in documents:
+            self.insert_one(document)
+
+    def _update(
+                self,
+                document: dict[str, Any],
+                update: dict[str, Any]
+            ) -> None:
+        """
+        Applies the `$set`, `$inc`, `$push`, and `$pull` operators of an
+        update to a document (`$pull` only removes values equal to the one
+        given)
+
+        Parameters
+        ----------
+        document : dict[str, Any]
+            The (stored) document to update
+        update : dict[str, Any]
+            The update to apply
+        """
+        document.update(update.get("$set", {}))
+        for key, value in update.get("$inc", {}).items():
+            document[key] = document.get(key, 0) + value
+        for key, value in update.get("$push", {}).items():
+            document[key] = document.get(key, []) + [value]
+        for key, value in update.get("$pull", {}).items():
+            document[key] = [
+                other for other in document.get(key, []) if other != value
+            ]
+
+        # Updated fields may be indexed
+        for key in list(self.indexes):
+            self.create_index(key)
+
+    def update_one(
+                self,
+                query: dict[str, Any],
+                update: dict[str, Any],
+                upsert: bool = False
+            ) -> None:
+        """
+        Updates the first document matching a query
+
+        Parameters
+        ----------
+        query : dict[str, Any]
+            The query to match
+        update : dict[str, Any]
+            The update to apply (see `_update()`)
+        upsert : bool, default=False
+            Whether or not to insert a document built from the query if none
+            match
+        """
+        self.find_one_and_update(query, update, upsert)
+
+    def find_one_and_update(
+                self,
+                query: dict[str, Any],
+                update: dict[str, Any],
+                upsert: bool = False,
+                return_document: bool = ReturnDocument.BEFORE
+            ) -> dict[str, Any] | None:
+        """
+        Updates the first document matching a query, returning it
+
+        Parameters
+        ----------
+        query : dict[str, Any]
+            The query to match
+        update : dict[str, Any]
+            The update to apply (see `_update()`)
+        upsert : bool, default=False
+            Whether or not to insert a document built from the query if none
+            match
+        return_document : bool, default=ReturnDocument.BEFORE
+            Whether to return the document as it was before or after the
+            update
+
+        Returns
+        -------
+        dict[str, Any] | None
+            A copy of the document, or None if there was none (before)
+        """
+        document = next(
+            (d for d in self._candidates(query) if _matches(d, query)), None
+        )
+        before = deepcopy(document)
+
+        if document is None:
+            if not upsert:
+                return None
+
+            # Like MongoDB, only the fields the query sets equal are
+            # inserted. If the _id exists, the query failed on another field
+            inserted = {
+                key: condition for key, condition in query.items()
+                if not _is_operator(condition)
+            }
+            if "_id" in inserted and self.find_one({"_id": inserted["_id"]}):
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error: {inserted['_id']}"
+                )
+
+            self.insert_one(inserted)
+            document = self.documents[-1]
+
+        self._update(document, update)
+
+        if return_document == ReturnDocument.AFTER:
+            return deepcopy(document)
+        return before
+
+    def find_one(
+                self,
+                query: dict[str, Any] | None = None
+            ) -> dict[str, Any] | None:
+        """
+        Finds the first document matching a query
+
+        Parameters
+        ----------
+        query : dict[str, Any] | None, default=None
+            The query to match. None matches every document
+
+        Returns
+        -------
+        dict[str, Any] | None
+            The first matching document, or None if none match
+        """
+        return next(iter(self.find(query)), None)
+
+    def find(
+                self,
+                query: dict[str, Any] | None = None,
+                projection: dict[str, Any] | None = None
+            ) -> LocalCursor:
+        """
+        Finds every document matching a query
+
+        Parameters
+        ----------
+        query : dict[str, Any] | None, default=None
+            The query to match. None matches every document
+        projection : dict[str, Any] | None, default=None
+            The fields to include in each document. None includes all fields
+
+        Returns
+        -------
+        LocalCursor
+            An iterable over the matching documents
+        """
+        query = query or {}
+        documents = (
+            document
+            for document in self._candidates(query)
+            if _matches(document, query)
+        )
+
+        if projection is not None:
+            fields = [key for key, value in projection.items() if value]
+            documents = (
+                {key: document[key] for key in fields if key in document}
+                for document in documents
+            )
+
+        return LocalCursor(documents)
+
+    def count_documents(self, query: dict[str, Any]) -> int:
+        """
+        Counts the documents matching a query
+
+        Parameters
+        ----------
+        query : dict[str, Any]
+            The query to match
+
+        Returns
+        -------
+        int
+            The number of matching documents
+        """
+        return sum(1 for _ in self.find(query))
+
+
+class LocalDatabase:
+    """An in-memory stand-in for a pymongo Database"""
+
+    def __init__(self) -> None:
+        self.collections: dict[str, LocalCollection] = {}
+
+    def __getitem__(self, name: str) -> LocalCollection:
+        if name not in self.collections:
+            self.collections[name] = LocalCollection()
+        return self.collections[name]
+
+    def __getattr__(self, name: str) -> LocalCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def list_collection_names(self) -> list[str]:
+        """
+        Retrieves the names of every collection
+
+        Returns
+        -------
+        list[str]
+            The name of every collection
+        """
+        return list(self.collections)
+
+    def drop_collection(self, name: str) -> None:
+        """
+        Drops a collection (and every document in it), if it exists
+
+        Parameters
+        ----------
+        name : str
+            The name of the collection to drop
+        """
+        self.collections.pop(name, None)
+
+
+class LocalClient:
+    """An in-memory stand-in for a pymongo MongoClient"""
+
+    def __init__(self) -> None:
+        self.databases: dict[str, LocalDatabase] = {}
+
+    def __getitem__(self, name: str) -> LocalDatabase:
+        if name not in self.databases:
+            self.databases[name] = LocalDatabase()
+        return self.databases[name]
+
+
+def reset_caches() -> None:
+    """
+    Forgets every index pointer and index file (vocabulary, spelling index,
+    ...) cached from whichever database was used before
+    """
+    DBCon.POINTER_CACHE.clear()
+    for index_file in (Vocabulary, SpellingIndex, LatentSemanticIndex):
+        index_file.reset()
+
+
+@contextmanager
+def local_dbcon() -> Iterator[LocalDatabase]:
+    """
+    Points the static DBCon connection at a fresh in-memory database for the
+    duration of the context, restoring the previous connection afterwards
+
+    The files built alongside each index version are written to a temporary
+    directory rather than the real INDEX_DATA, and nothing cached from the
+    previous database (index pointers, index files) carries over, in either
+    direction
+
+    Yields
+    ------
+    LocalDatabase
+        The in-memory database DBCon now uses
+    """
+    previous = DBCon.CLIENT, DBCon.DB, DBCon.INDEX_DATA
+
+    with TemporaryDirectory() as index_data:
+        client = LocalClient()
+        DBCon.CLIENT = client  # type: ignore
+        DBCon.DB = client[DBCon.DB_NAME]  # type: ignore
+        DBCon.INDEX_DATA = index_data
+        reset_caches()
+
+        try:
+            yield DBCon.DB  # type: ignore
+        finally:
+            DBCon.CLIENT, DBCon.DB, DBCon.INDEX_DATA = previous
+            reset_caches()
@@ -0,0 +1,169 @@
+import json
+import tracemalloc
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from io import StringIO
+from time import perf_counter
+from typing import Any
+
+from search_engine.crawler import crawl
+from search_engine.database import DBCon
+from search_engine.frontier import Frontier
+from search_engine.indexer import index_faculty_content
+from search_engine.metrics import percentile
+from search_engine.ranker import rank
+
+from .fixture_server import FixtureServer
+from .local_db import local_dbcon
+from .synthetic_site import generate_queries, generate_site
+
+
+def bench_size(
+            num_faculty: int,
+            num_queries: int,
+            n_grams: int,
+            seed: int
+        ) -> dict[str, Any]:
+    """
+    Benchmarks every stage for a corpus of num_faculty faculty members
+
+    Parameters
+    ----------
+    num_faculty : int
+        The number of faculty (target) pages in the corpus
+    num_queries : int
+        The number of queries to rank
+    n_grams : int
+        The number of grams to index and rank with
+    seed : int
+        The seed used to generate the site and queries
+
+    Returns
+    -------
+    dict[str, Any]
+        The measurements for each stage
+    """
+    results: dict[str, Any] = {"num_faculty": num_faculty}
+
+    with FixtureServer() as server, local_dbcon() as db:
+        server.pages.update(generate_site(server.base_url, num_faculty, seed))
+
+        # Crawl
+        frontier = Frontier()
+        frontier.add_url(server.base_url + "/index.shtml")
+        start = perf_counter()
+        with redirect_stdout(StringIO()):
+            crawl(frontier, num_faculty)
+        elapsed = perf_counter() - start
+
+        num_pages = db.pages.count_documents({})
+        results["crawl"] = {
+            "pages": num_pages,
+            "seconds": elapsed,
+            "pages_per_sec": num_pages / elapsed,
+        }
+
+        # Index. Tracing allocations slows the build down several times
+        # over, so the time and the peak memory are measured by separate
+        # builds (each publishes a version of the same index)
+        start = perf_counter()
+        with redirect_stdout(StringIO()):
+            index_faculty_content(num_faculty, n_grams)
+        elapsed = perf_counter() - start
+
+        tracemalloc.start()
+        with redirect_stdout(StringIO()):
+            index_faculty_content(num_faculty, n_grams)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results["index"] = {
+            "terms": db[DBCon.get_index_collection()].count_documents({}),
+            "seconds": elapsed,
+            "peak_bytes": peak,
+        }
+
+        # Query
+        latencies: list[float] = []
+        for query in generate_queries(num_queries, seed):
+            start = perf_counter()
+            rank(query, n_grams)
+            latencies.append(perf_counter() - start)
+
+        results["query"] = {
+            "queries": num_queries,
+            "p50_seconds": percentile(latencies, 0.50),
+            "p99_seconds": percentile(latencies, 0.99),
+            "queries_per_sec": num_queries / (sum(latencies) or 1),
+        }
+
+    return results
+
+
+def main() -> None:
+    """
+    Parses the command line arguments and runs the benchmarks. Every stage
+    runs end-to-end against a synthetic faculty site served from localhost
+    and an in-memory stand-in for MongoDB, for a range of corpus sizes
+
+    Usage (from the repository root):
+    `python -m benchmarks.run --sizes 10 50 200 --output bench.jsonl`
+
+    Each run is appended as one JSON line to --output, so results can be
+    tracked over time
+    """
+    parser = ArgumentParser(description="Benchmark crawl, index, and query")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10, 50, 200],
+        help="The corpus sizes (number of faculty pages) to benchmark"
+    )
+    parser.add_argument(
+        "--queries", type=int, default=50,
+        help="The number of queries to rank for each size"
+    )
+    parser.add_argument(
+        "--n-grams", type=int, default=3,
+        help="The number of grams to index and rank with"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="The seed used to generate the corpus and queries"
+    )
+    parser.add_argument(
+        "--output", default=None,
+        help="A JSONL file to append this run's results to"
+    )
+    args = parser.parse_args()
+
+    run: dict[str, Any] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "n_grams": args.n_grams,
+        "seed": args.seed,
+        "sizes": [],
+    }
+
+    for size in args.sizes:
+        result = bench_size(size, args.queries, args.n_grams, args.seed)
+        run["sizes"].append(result)
+
+        crawl_, index, query = (
+            result["crawl"], result["index"], result["query"]
+        )
+        print(
+            f"{size:>6,} faculty | " +
+            f"crawl {crawl_['pages_per_sec']:8.1f} pages/s | " +
+            f"index {index['seconds']:7.3f}s " +
+            f"{index['peak_bytes'] / 2 ** 20:7.1f}MiB " +
+            f"({index['terms']:,} terms) | " +
+            f"query p50 {query['p50_seconds'] * 1000:7.2f}ms " +
+            f"p99 {query['p99_seconds'] * 1000:7.2f}ms"
+        )
+
+    if args.output:
+        with open(args.output, "a", encoding="utf-8") as file:
+            file.write(json.dumps(run) + "\n")
+
+
+if __name__ == '__main__':
+    main()
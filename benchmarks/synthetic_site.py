@@ -0,0 +1,201 @@
+from random import Random
+
+# The words research areas and bios are drawn from. Several share prefixes
+# and lemmas so that n-grams, autocompletion, and spelling all have work to do
+RESEARCH_WORDS: list[str] = [
+    "biology", "microbiology", "ecology", "ecosystem", "environmental",
+    "environment", "genetics", "genomics", "evolution", "evolutionary",
+    "marine", "molecular", "cellular", "physiology", "botany", "zoology",
+    "neuroscience", "biochemistry", "immunology", "virology", "bacteria",
+    "conservation", "climate", "population", "structural", "engineering",
+    "hydraulics", "geotechnical", "transportation", "concrete", "steel",
+    "seismic", "water", "resources", "sustainability", "infrastructure",
+    "marketing", "international", "business", "trade", "consumer",
+    "behavior", "analytics", "strategy", "supply", "chain", "management",
+    "finance", "economics", "entrepreneurship", "global", "brand", "digital",
+    "statistics", "modeling", "simulation", "machine", "learning", "data",
+]
+
+FILLER_WORDS: list[str] = [
+    "the", "professor", "teaches", "courses", "in", "and", "research",
+    "focuses", "on", "of", "with", "students", "department", "university",
+    "studies", "interests", "include", "award", "grant", "published",
+]
+
+
+def _sentence(rng: Random, length: int) -> str:
+    """
+    Generates a sentence mixing research words and filler words
+
+    Parameters
+    ----------
+    rng : Random
+        The random number generator to draw words from
+    length : int
+        The number of words in the sentence
+
+    Returns
+    -------
+    str
+        The generated sentence
+    """
+    words = [
+        rng.choice(RESEARCH_WORDS if rng.random() < 0.5 else FILLER_WORDS)
+        for _ in range(length)
+    ]
+    return ' '.join(words).capitalize() + "."
+
+
+def faculty_page(base_url: str, index: int, rng: Random) -> str:
+    """
+    Generates the HTML of a faculty member's page, shaped like the real
+    cpp.edu pages: a `fac-info` block marks it as a target and its `col` and
+    `accolades` blocks hold the text that gets indexed
+
+    Parameters
+    ----------
+    base_url : str
+        The URL the site is served from (without a trailing slash)
+    index : int
+        The index of the faculty member
+    rng : Random
+        The random number generator to draw text from
+
+    Returns
+    -------
+    str
+        The HTML of the page
+    """
+    bio = ' '.join(_sentence(rng, rng.randint(8, 20)) for _ in range(6))
+    accolades = ''.join(
+        f"<li>{_sentence(rng, rng.randint(4, 10))}</li>" for _ in range(4)
+    )
+
+    return (
+        "<html><head><title>Faculty</title></head><body>"
+        f"<a href=\"{base_url}/index.shtml\">Home</a>"
+        "<div class=\"fac-info\">"
+        f"<h1>Faculty Member {index}</h1>"
+        f"<a href=\"mailto:faculty{index}@example.edu\">Email</a>"
+        "</div>"
+        f"<div class=\"col\"><p>{bio}</p></div>"
+        f"<div class=\"accolades\"><ul>{accolades}</ul></div>"
+        "</body></html>"
+    )
+
+
+def filler_page(base_url: str, index: int, rng: Random) -> str:
+    """
+    Generates the HTML of a page that is not a target (news, events, etc.)
+
+    Parameters
+    ----------
+    base_url : str
+        The URL the site is served from (without a trailing slash)
+    index : int
+        The index of the page
+    rng : Random
+        The random number generator to draw text from
+
+    Returns
+    -------
+    str
+        The HTML of the page
+    """
+    body = ' '.join(_sentence(rng, rng.randint(8, 20)) for _ in range(3))
+    return (
+        f"<html><head><title>News {index}</title></head><body>"
+        f"<a href=\"{base_url}/index.shtml\">Home</a>"
+        f"<p>{body}</p>"
+        "</body></html>"
+    )
+
+
+def generate_site(
+            base_url: str,
+            num_faculty: int,
+            seed: int = 0,
+            per_directory: int = 10
+        ) -> dict[str, str]:
+    """
+    Generates a synthetic department site. The seed page
+    (`/index.shtml`) links to news pages and to directory pages, each of which
+    lists up to per_directory faculty pages
+
+    Every link is absolute, since the crawler only follows absolute URLs (or
+    ones relative to cpp.edu)
+
+    Parameters
+    ----------
+    base_url : str
+        The URL the site is served from (without a trailing slash)
+    num_faculty : int
+        The number of faculty (target) pages to generate
+    seed : int, default=0
+        The seed of the random number generator, so sites are reproducible
+    per_directory : int, default=10
+        The number of faculty members listed on each directory page
+
+    Returns
+    -------
+    dict[str, str]
+        A map of each page's path (e.g. `/faculty/3.shtml`) to its HTML
+    """
+    rng = Random(seed)
+    pages: dict[str, str] = {}
+
+    directories: list[str] = []
+    for start in range(0, num_faculty, per_directory):
+        path = f"/directory/{len(directories)}.shtml"
+        links = ''.join(
+            f"<li><a href=\"{base_url}/faculty/{i}.shtml\">Faculty {i}</a>"
+            "</li>"
+            for i in range(start, min(start + per_directory, num_faculty))
+        )
+        pages[path] = (
+            "<html><body>"
+            "<div class=\"col-md directory-listing\">"
+            f"<ul>{links}</ul></div>"
+            "</body></html>"
+        )
+        directories.append(path)
+
+    for i in range(num_faculty):
+        pages[f"/faculty/{i}.shtml"] = faculty_page(base_url, i, rng)
+
+    num_filler = max(1, num_faculty // 5)
+    for i in range(num_filler):
+        pages[f"/news/{i}.shtml"] = filler_page(base_url, i, rng)
+
+    links = ''.join(
+        f"<a href=\"{base_url}{path}\">{path}</a>"
+        for path in (
+            [f"/news/{i}.shtml" for i in range(num_filler)] + directories
+        )
+    )
+    pages["/index.shtml"] = f"<html><body>{links}</body></html>"
+
+    return pages
+
+
+def generate_queries(num_queries: int, seed: int = 0) -> list[str]:
+    """
+    Generates queries of one to three research words
+
+    Parameters
+    ----------
+    num_queries : int
+        The number of queries to generate
+    seed : int, default=0
+        The seed of the random number generator, so queries are reproducible
+
+    Returns
+    -------
+    list[str]
+        The generated queries
+    """
+    rng = Random(seed)
+    return [
+        ' '.join(rng.sample(RESEARCH_WORDS, rng.randint(1, 3)))
+        for _ in range(num_queries)
+    ]
@@ -1,6 +1,10 @@
+from search_engine.batch import batch_query
 from search_engine.crawler import crawl
+from search_engine.database import DBCon
 from search_engine.frontier import Frontier
-from search_engine.indexer import index_faculty_content
+from search_engine.indexer import index_faculty_content, index_shard_files
+from search_engine.metrics import Metrics
+from search_engine.profiling import profile_phase
 from search_engine.ranker import query_user
 
 
@@ -29,11 +33,61 @@ def main():
     # 2-gram = "cats", "cats love"
     # 3-gram = "cats", "cats love", "cats love dogs"
     _N_GRAMS = 3
+    # Whether or not to also build a latent semantic index (LSA) when
+    # indexing, and to rank queries with it. LSA also finds pages about
+    # related concepts ("ecology" finds "ecosystems") and answers queries
+    # without fetching any pages
+    _LSA = False
+    # The number of dimensions LSA reduces every page to
+    _LSA_COMPONENTS = 100
+
+    # Whether or not to SHARD the index. When INDEXING, the targets of
+    # DEPARTMENT are indexed into that department's own shard (or, if
+    # _HASH_SHARDS is set, every target is indexed into one of _HASH_SHARDS
+    # shards by the hash of its URL). Queries then fan out concurrently
+    # across every one of the _HASH_SHARDS shards if it is set, or else
+    # across the shards of _QUERY_DEPARTMENTS (every department if None).
+    # Every shard shares one vocabulary and spelling index, rebuilt after
+    # indexing. Shards can't be used with _LSA
+    _SHARD = False
+    _HASH_SHARDS: int | None = None
+    _QUERY_DEPARTMENTS: list[str] | None = None
 
     # Whether or not to ask for a user QUERY.
     _QUERY = True
     # The maximum number of results to return for each query
     _N_RESULTS = 5
+
+    # Whether or not to rank a BATCH of queries instead of asking the user.
+    # Queries are read one per line (plain text or JSONL with a `query` key)
+    # from _BATCH_INPUT and the ranked results, alongside the latency of each
+    # query, are written as JSONL to _BATCH_OUTPUT. Use "-" for stdin/stdout
+    _BATCH = False
+    _BATCH_INPUT = "queries.txt"
+    _BATCH_OUTPUT = "results.jsonl"
+    # The number of queries to rank concurrently
+    _BATCH_WORKERS = 4
+
+    # Whether or not to record METRICS (timings and counts of fetching,
+    # parsing, tokenizing, DB reads/writes, and scoring). A JSON snapshot is
+    # written to _METRICS_OUTPUT once the program is done, and if
+    # _METRICS_PORT is set, a Prometheus text endpoint is served at
+    # http://localhost:<_METRICS_PORT>/metrics while it runs
+    _METRICS = False
+    _METRICS_OUTPUT = "metrics.json"
+    _METRICS_PORT: int | None = None
+
+    # Whether or not to PROFILE each phase with cProfile. Profiles (pstats,
+    # flamegraph-compatible folded stacks, and a text report of the slowest
+    # functions and the time spent per library) are written to _PROFILE_DIR
+    _PROFILE_CRAWL = False
+    _PROFILE_INDEX = False
+    _PROFILE_QUERY = False
+    # Whether or not to also report the top allocation sites (tracemalloc)
+    _PROFILE_MEMORY = False
+    _PROFILE_DIR = "profiles"
+    # The number of functions and allocation sites to report
+    _PROFILE_TOP_N = 20
     ###########################################################################
 
     # The base CPP URL
@@ -55,6 +109,12 @@ def main():
 
     seed, num_targets, total_targets = DEPARTMENTS[DEPARTMENT]
     assert num_targets <= total_targets
+    assert not (_SHARD and _LSA), "Shards can't be used with LSA."
+
+    if _METRICS:
+        Metrics.enable()
+        if _METRICS_PORT is not None:
+            Metrics.serve(_METRICS_PORT)
 
     if _CRAWL:
         print(
@@ -63,17 +123,69 @@ def main():
         )
         frontier = Frontier()
         frontier.add_url(seed)
-        crawl(frontier, num_targets)
+        with profile_phase(
+                    "crawl", _PROFILE_CRAWL, _PROFILE_DIR,
+                    _PROFILE_MEMORY, _PROFILE_TOP_N
+                ):
+            crawl(frontier, num_targets, DEPARTMENT)
 
     if _INDEX:
         print(
             f"Attempting to index {num_targets} targets " +
             f"using {_N_GRAMS} n-grams"
         )
-        index_faculty_content(num_targets, _N_GRAMS)
+        with profile_phase(
+                    "index", _PROFILE_INDEX, _PROFILE_DIR,
+                    _PROFILE_MEMORY, _PROFILE_TOP_N
+                ):
+            if not _SHARD:
+                index_faculty_content(
+                    num_targets, _N_GRAMS,
+                    lsa_components=_LSA_COMPONENTS if _LSA else None
+                )
+            elif _HASH_SHARDS is not None:
+                for shard in range(_HASH_SHARDS):
+                    index_faculty_content(
+                        num_targets, _N_GRAMS,
+                        hash_shard=(shard, _HASH_SHARDS)
+                    )
+                index_shard_files(_HASH_SHARDS)
+            else:
+                index_faculty_content(
+                    num_targets, _N_GRAMS, department=DEPARTMENT
+                )
+                index_shard_files()
+
+    # Only query shards of one kind, as pages are in both a department
+    # shard and a hash shard
+    shards: list[str] | None = None
+    if _SHARD and _HASH_SHARDS is not None:
+        shards = [
+            DBCon.get_hash_index(shard, _HASH_SHARDS)
+            for shard in range(_HASH_SHARDS)
+        ]
+    elif _SHARD:
+        shards = [
+            DBCon.get_department_index(department)
+            for department in _QUERY_DEPARTMENTS or []
+        ]
+
+    if _BATCH or _QUERY:
+        with profile_phase(
+                    "query", _PROFILE_QUERY, _PROFILE_DIR,
+                    _PROFILE_MEMORY, _PROFILE_TOP_N
+                ):
+            if _BATCH:
+                batch_query(
+                    _BATCH_INPUT, _BATCH_OUTPUT, _N_RESULTS, _N_GRAMS,
+                    _BATCH_WORKERS, _LSA, shards
+                )
+            else:
+                query_user(_N_RESULTS, _N_GRAMS, _LSA, shards)
 
-    if _QUERY:
-        query_user(_N_RESULTS, _N_GRAMS)
+    if _METRICS:
+        Metrics.write_json(_METRICS_OUTPUT)
+        print(f"Metrics written to {_METRICS_OUTPUT}.")
 
 
 if __name__ == '__main__':
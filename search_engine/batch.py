@@ -0,0 +1,235 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import IO, Iterator, TypedDict
+
+from .database import DBCon
+from .metrics import percentile
+from .parser import preprocess_text
+from .ranker import rank, rank_lsa, rank_sharded
+
+
+class BatchResult(TypedDict):
+    """
+    A TypedDict defining the result of a single query in a batch
+
+    A BatchResult has the query (query : str), the top ranked URLs and their
+    cosine similarities (results : list[tuple[str, float]]), the total
+    number of URLs found (num_found : int), and how long the query took to
+    rank in seconds (latency : float)
+    """
+    query: str
+    results: list[tuple[str, float]]
+    num_found: int
+    latency: float
+
+
+def read_queries(stream: IO[str]) -> Iterator[str]:
+    """
+    Reads queries from a stream, one per line. Blank lines are skipped.
+
+    Lines may either be plain text (the query itself) or JSONL, in which case
+    the query is read from the `query` key:
+    {"query": "marine biology"}
+
+    JSONL lines that cannot be parsed or have no string `query` are reported
+    on stderr and skipped, so one bad line does not abort the whole batch
+
+    Parameters
+    ----------
+    stream : IO[str]
+        The stream (file or stdin) to read queries from
+
+    Yields
+    ------
+    str
+        Each query found
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+
+        if not line.startswith("{"):
+            yield line
+            continue
+
+        try:
+            query = json.loads(line)["query"]
+        except (json.JSONDecodeError, KeyError, TypeError) as e:
+            print(
+                f"Skipping line {line_number}: {type(e).__name__}: {e}",
+                file=sys.stderr
+            )
+            continue
+
+        if not isinstance(query, str):
+            print(
+                f"Skipping line {line_number}: query is not a string",
+                file=sys.stderr
+            )
+            continue
+
+        yield query
+
+
+def rank_one(
+            query: str,
+            n_results: int,
+            n_grams: int,
+            documents_cache: dict[str, str],
+            use_lsa: bool = False,
+            shards: list[str] | None = None
+        ) -> BatchResult:
+    """
+    Ranks a single query, timing how long the ranking takes
+
+    Parameters
+    ----------
+    query : str
+        The query to rank
+    n_results : int
+        The maximum number of ranked URLs to keep
+    n_grams : int
+        The upper-bound of n-grams to use for TF-IDF calculations
+    documents_cache : dict[str, str]
+        The map of URL to pre-processed document text shared by the batch
+    use_lsa : bool, default=False
+        Whether to rank with the latent semantic index (`rank_lsa`) instead
+        of `rank`
+    shards : list[str] | None, default=None
+        If given, rank across these shards with `rank_sharded` instead. An
+        empty list means every published department shard. Can't be
+        combined with use_lsa
+
+    Returns
+    -------
+    BatchResult
+        The ranked results of the query and its latency
+    """
+    if use_lsa and shards is not None:
+        raise ValueError("Shards can't be searched with LSA.")
+
+    start = perf_counter()
+    if use_lsa:
+        ranking, num_found = rank_lsa(query, n_grams, n_results)
+    elif shards is not None:
+        ranking, num_found = rank_sharded(
+            query, n_grams, shards or None, n_results, documents_cache
+        )
+    else:
+        ranking = rank(query, n_grams, documents_cache)
+        num_found = len(ranking)
+    latency = perf_counter() - start
+
+    return {
+        "query": query,
+        "results": ranking[:n_results],
+        "num_found": num_found,
+        "latency": latency
+    }
+
+
+def batch_query(
+            input_path: str,
+            output_path: str,
+            n_results: int,
+            n_grams: int,
+            num_workers: int = 4,
+            use_lsa: bool = False,
+            shards: list[str] | None = None
+        ) -> list[BatchResult]:
+    """
+    Ranks every query found in input_path across a pool of workers and writes
+    the ranked results (alongside the latency of each query) to output_path
+    as JSONL, in the same order as the queries were given
+
+    Every worker shares the same static DB connection and a single cache of
+    pre-processed documents, so a page is only fetched and tokenized once
+    per batch no matter how many queries it is a candidate for.
+
+    Parameters
+    ----------
+    input_path : str
+        The file to read queries from, or "-" to read from stdin
+    output_path : str
+        The file to write results to, or "-" to write to stdout
+    n_results : int
+        The maximum number of ranked URLs to keep for each query
+    n_grams : int
+        The upper-bound of n-grams to use for TF-IDF calculations
+    num_workers : int, default=4
+        The number of queries to rank concurrently
+    use_lsa : bool, default=False
+        Whether to rank with the latent semantic index (`rank_lsa`) instead
+        of `rank`
+    shards : list[str] | None, default=None
+        If given, rank across these shards with `rank_sharded` instead. An
+        empty list means every published department shard. Can't be
+        combined with use_lsa
+
+    Returns
+    -------
+    list[BatchResult]
+        The results of every query, in order
+    """
+    if use_lsa and shards is not None:
+        raise ValueError("Shards can't be searched with LSA.")
+
+    if input_path == "-":
+        queries = list(read_queries(sys.stdin))
+    else:
+        with open(input_path, encoding="utf-8") as file:
+            queries = list(read_queries(file))
+
+    # Connect and load the NLTK corpora up front. Both are lazily initialized
+    # and doing so from several threads at once is not safe
+    DBCon.get_db()
+    preprocess_text("warm up")
+
+    documents_cache: dict[str, str] = {}
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        results = list(executor.map(
+            lambda query: rank_one(
+                query, n_results, n_grams, documents_cache, use_lsa,
+                shards
+            ),
+            queries
+        ))
+    elapsed = perf_counter() - start
+
+    if output_path == "-":
+        write_results(sys.stdout, results)
+    else:
+        with open(output_path, "w", encoding="utf-8") as file:
+            write_results(file, results)
+
+    if results:
+        latencies = [result["latency"] for result in results]
+        p50 = percentile(latencies, 0.50)
+        p99 = percentile(latencies, 0.99)
+        print(
+            f"{len(results):,} queries ranked in {elapsed:.4f}s " +
+            f"({len(results) / elapsed:.2f} queries/sec, " +
+            f"p50 {p50:.4f}s, p99 {p99:.4f}s).",
+            file=sys.stderr
+        )
+
+    return results
+
+
+def write_results(stream: IO[str], results: list[BatchResult]) -> None:
+    """
+    Writes batch results to a stream as JSONL (one result per line)
+
+    Parameters
+    ----------
+    stream : IO[str]
+        The stream (file or stdout) to write results to
+    results : list[BatchResult]
+        The results to write
+    """
+    for result in results:
+        stream.write(json.dumps(result) + "\n")
@@ -1,9 +1,14 @@
 from .database import DBCon
 from .frontier import Frontier
+from .metrics import Metrics
 from .parser import fetch_html, is_target, parse_html
 
 
-def crawl(frontier: Frontier, num_targets: int):
+def crawl(
+            frontier: Frontier,
+            num_targets: int,
+            department: str | None = None
+        ):
     """
     Procedurally discovers and adds URLs to the given frontier
 
@@ -14,6 +19,9 @@ def crawl(frontier: Frontier, num_targets: int):
     num_targets : int
         The number of targets to look for. We clear the frontier once we
         have hit this target
+    department : str | None, default=None
+        The department the frontier was seeded from. Every page stored is
+        tagged with it, so it can be indexed into the department's shard
     """
 
     links_visited: set[str] = set()
@@ -29,7 +37,8 @@ def crawl(frontier: Frontier, num_targets: int):
                 targets_found += 1
                 print(f"Target found ({targets_found}/{num_targets}).")
 
-            DBCon.store_page(url, html, target)
+            DBCon.store_page(url, html, target, department)
+            Metrics.inc("pages_crawled_total", is_target=str(target).lower())
 
             if targets_found == num_targets:
                 frontier.clear()
@@ -46,4 +55,5 @@ def crawl(frontier: Frontier, num_targets: int):
                     frontier.add_url(url)
 
         except Exception as e:
+            Metrics.inc("pages_skipped_total")
             print(f"Skipping page: {e}")
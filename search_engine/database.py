@@ -1,9 +1,15 @@
-from typing import TypedDict
+import os
+import re
+from time import monotonic, perf_counter
+from typing import Iterator, NotRequired, TypedDict
+from uuid import uuid4
 
 from bs4 import BeautifulSoup
-from pymongo import MongoClient
-from pymongo.cursor import Cursor
+from pymongo import MongoClient, ReturnDocument
 from pymongo.database import Database
+from pymongo.errors import DuplicateKeyError
+
+from .metrics import Metrics
 
 
 class Page(TypedDict):
@@ -11,11 +17,14 @@ class Page(TypedDict):
     A TypedDict defining what a Page is
 
     A Page has a URL (url : str), the associated HTML content (html : str),
-    and whether or not the page belongs to a faculty member (is_target : bool)
+    whether or not the page belongs to a faculty member (is_target : bool),
+    and the department whose seed it was crawled from, if known
+    (department : str)
     """
     url: str
     html: str
     is_target: bool
+    department: NotRequired[str]
 
 
 class InvertedIndex(TypedDict):
@@ -43,6 +52,26 @@ class DBCon:
     DB_HOST = "localhost"
     DB_PORT = 27017
 
+    # The inverted index is built into a new, versioned collection
+    # (`faculty_v1_<build id>`, `faculty_v2_<build id>`, ...) each time. A
+    # pointer document per index in INDEX_POINTERS says which version queries
+    # read from, and which versions have been published. Version numbers
+    # start over in every database, so the random build id is what tells
+    # builds apart
+    INDEX_NAME = "faculty"
+    INDEX_POINTERS = "index_pointers"
+    # Where the files built alongside each version (vocabulary, spelling
+    # index, ...) are stored (see `get_index_data_dir`)
+    INDEX_DATA = "index_data"
+    # How many versions to keep (the active one and the one before it, which
+    # queries that resolved the pointer just before a swap may still read)
+    KEEP_VERSIONS = 2
+    # How long a resolved pointer is trusted for, in seconds, before it is
+    # looked up again
+    POINTER_TTL = 1.0
+    # Index name -> (collection, when it was resolved)
+    POINTER_CACHE: dict[str, tuple[str, float]] = {}
+
     def __init__(self) -> None:
         """
         Technically, instance objects should not be made of DBCon,
@@ -138,10 +167,12 @@ class DBCon:
         return not ((DBCon.CLIENT is not None) ^ (DBCon.DB is not None))
 
     @staticmethod
+    @Metrics.timed("db_write_seconds", op="store_page")
     def store_page(
                 url: str,
                 html: BeautifulSoup,
-                is_target: bool = False
+                is_target: bool = False,
+                department: str | None = None
             ) -> None:
         """
         Stores the entirety of the HTML associated with a URL in a MongoDB
@@ -155,18 +186,30 @@ class DBCon:
         is_target : bool, default=False
             Whether or not this is a page belonging to a target
             (a faculty member)
+        department : str | None, default=None
+            The department whose seed the page was crawled from, which lets
+            the page be indexed into that department's shard
         """
         db = DBCon.get_db()
         pages = db.pages
 
-        pages.insert_one({
+        page: Page = {
             "url": url,
             "html": html.decode(),
             "is_target": is_target
-        })
+        }
+        if department is not None:
+            page["department"] = department
+
+        pages.insert_one(page)
 
     @staticmethod
-    def store_inverted_index(term: str, doc_list: set[str]) -> None:
+    @Metrics.timed("db_write_seconds", op="store_inverted_index")
+    def store_inverted_index(
+                term: str,
+                doc_list: set[str],
+                collection: str
+            ) -> None:
         """
         Stores the inverted index associated with a given term. Essentially,
         we store a set of documents in which the term occurs.
@@ -184,9 +227,12 @@ class DBCon:
             The term whose indices we are storing
         doc_list : set[str]
             The set of document URLs in which this term occurs
+        collection : str
+            The collection to store the index in (from `begin_index_build`).
+            Published collections are never written to
         """
         db = DBCon.get_db()
-        faculty = db.faculty
+        faculty = db[collection]
 
         faculty.insert_one({
             "term": term,
@@ -194,6 +240,36 @@ class DBCon:
         })
 
     @staticmethod
+    @Metrics.timed("db_write_seconds", op="store_inverted_indices")
+    def store_inverted_indices(
+                indices: list[tuple[str, list[str]]],
+                collection: str
+            ) -> None:
+        """
+        Stores many inverted indices at once (see `store_inverted_index`),
+        in a single round trip
+
+        Parameters
+        ----------
+        indices : list[tuple[str, list[str]]]
+            Each term and the list of document URLs in which it occurs
+        collection : str
+            The collection to store the indices in (from
+            `begin_index_build`). Published collections are never written to
+        """
+        db = DBCon.get_db()
+        faculty = db[collection]
+
+        faculty.insert_many(
+            [
+                {"term": term, "doc_list": doc_list}
+                for term, doc_list in indices
+            ],
+            ordered=False
+        )
+
+    @staticmethod
+    @Metrics.timed("db_read_seconds", op="get_page")
     def get_page(url: str) -> Page:
         """
         Retrieves a Page associated with a URL
@@ -216,27 +292,60 @@ class DBCon:
         return result or {"url": "", "html": "", "is_target": False}
 
     @staticmethod
-    def get_targets(num_targets: int) -> Cursor[Page]:
+    def get_targets(
+                num_targets: int,
+                department: str | None = None
+            ) -> Iterator[Page]:
         """
         Retrieves a maximum of num_targets target pages. If we don't have that
         many targets, all of our targets will be returned
 
+        Pages are read from MongoDB lazily, in batches, as they are iterated
+        over. The time spent waiting on those reads (but not on whatever is
+        done with each page in between) is recorded once iteration ends
+
         Parameters
         ----------
         num_targets : int
             The (maximum) number of targets to retrieve
+        department : str | None, default=None
+            If given, only targets crawled from this department's seed are
+            retrieved
 
-        Returns
-        -------
-        Cursor[Page]
-            An iterable object that allows for iteration over the results of a
-            query
+        Yields
+        ------
+        Page
+            Each target found
         """
         db = DBCon.get_db()
-        return db.pages.find({'is_target': True}).limit(num_targets)
+
+        query: dict[str, bool | str] = {'is_target': True}
+        if department is not None:
+            query['department'] = department
+
+        elapsed = 0.0
+        start = perf_counter()
+        cursor: Iterator[Page] = iter(db.pages.find(query).limit(num_targets))
+        try:
+            while True:
+                try:
+                    page = next(cursor)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += perf_counter() - start
+
+                yield page
+                start = perf_counter()
+        finally:
+            Metrics.observe("db_read_seconds", elapsed, op="get_targets")
 
     @staticmethod
-    def get_inverted_index(term: str) -> InvertedIndex:
+    @Metrics.timed("db_read_seconds", op="get_inverted_index")
+    def get_inverted_index(
+                term: str,
+                name: str | None = None
+            ) -> InvertedIndex:
         """
         Retrieves the indices associated with the given term (ie, the
         URLs in which the term occurs)
@@ -245,6 +354,9 @@ class DBCon:
         ----------
         term : str
             The term to search for
+        name : str | None, default=None
+            The name of the index to search (see `get_index_collection`).
+            INDEX_NAME is used if None
 
         Returns
         -------
@@ -255,6 +367,317 @@ class DBCon:
             (meaning `{"term": "", "doc_list": []}`)
         """
         db = DBCon.get_db()
-        result = db.faculty.find_one({'term': term})
+        collection = DBCon.get_index_collection(name)
+        result = db[collection].find_one({'term': term})
+
+        Metrics.inc("postings_lookups_total")
+        if result:
+            Metrics.inc("postings_returned_total", len(result['doc_list']))
+        else:
+            Metrics.inc("postings_misses_total")
 
         return result if result else {"term": "", "doc_list": []}
+
+    @staticmethod
+    def get_index_collection(name: str | None = None) -> str:
+        """
+        Retrieves the collection the active version of an index is stored in,
+        by resolving its pointer (which is cached for POINTER_TTL seconds)
+
+        Parameters
+        ----------
+        name : str | None, default=None
+            The name of the index. INDEX_NAME is used if None
+
+        Returns
+        -------
+        str
+            The active collection, or the name of the index itself if it has
+            never been published (the collection it was originally built in)
+        """
+        name = name or DBCon.INDEX_NAME
+
+        cached = DBCon.POINTER_CACHE.get(name)
+        if cached is not None and monotonic() - cached[1] < DBCon.POINTER_TTL:
+            return cached[0]
+
+        db = DBCon.get_db()
+        pointer = db[DBCon.INDEX_POINTERS].find_one({'_id': name})
+        collection = pointer['collection'] if pointer else name
+
+        DBCon.POINTER_CACHE[name] = (collection, monotonic())
+        return collection
+
+    @staticmethod
+    def begin_index_build(name: str | None = None) -> str:
+        """
+        Creates a new, empty (shadow) collection to build the next version of
+        an index in. Queries keep reading the active version until the new
+        one is published with `publish_index`
+
+        Parameters
+        ----------
+        name : str | None, default=None
+            The name of the index. INDEX_NAME is used if None
+
+        Returns
+        -------
+        str
+            The collection to build the new version in
+        """
+        name = name or DBCon.INDEX_NAME
+        db = DBCon.get_db()
+
+        # Versions are handed out by a counter, so concurrent builds never
+        # share a collection
+        counter = db[DBCon.INDEX_POINTERS].find_one_and_update(
+            {'_id': f"{name}:next_version"},
+            {'$inc': {'version': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        collection = f"{name}_v{counter['version']}_{uuid4().hex[:8]}"
+
+        db.drop_collection(collection)
+        db[collection].create_index('term', unique=True)
+
+        return collection
+
+    @staticmethod
+    def publish_index(collection: str, name: str | None = None) -> list[str]:
+        """
+        Atomically points an index at a fully built collection (a single
+        conditional document update), then drops all but the KEEP_VERSIONS
+        most recent published versions
+
+        The pointer only ever moves forward: if a newer version was
+        published while this one was being built, the collection is dropped
+        instead. Versions that were never published (such as builds still
+        running) are never dropped
+
+        Parameters
+        ----------
+        collection : str
+            The collection to publish (from `begin_index_build`)
+        name : str | None, default=None
+            The name of the index. INDEX_NAME is used if None
+
+        Returns
+        -------
+        list[str]
+            The collections that were dropped, which include collection
+            itself if it was not published
+        """
+        name = name or DBCon.INDEX_NAME
+        db = DBCon.get_db()
+
+        version = DBCon.get_index_version(collection, name)
+        if version is None:
+            raise ValueError(f"{collection} is not a version of {name}.")
+
+        # Pointers published before versions were recorded have none, and
+        # are always replaced
+        try:
+            pointer = db[DBCon.INDEX_POINTERS].find_one_and_update(
+                {'_id': name, 'version': {'$not': {'$gte': version}}},
+                {
+                    '$set': {'collection': collection, 'version': version},
+                    '$push': {'published': collection}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The pointer exists but is at a newer version already
+            db.drop_collection(collection)
+            return [collection]
+
+        DBCon.POINTER_CACHE[name] = (collection, monotonic())
+
+        published = sorted(
+            pointer['published'],
+            key=lambda other: DBCon.get_index_version(other, name) or 0
+        )
+        dropped = published[:-DBCon.KEEP_VERSIONS]
+        for other in dropped:
+            db.drop_collection(other)
+            db[DBCon.INDEX_POINTERS].update_one(
+                {'_id': name}, {'$pull': {'published': other}}
+            )
+
+        return dropped
+
+    @staticmethod
+    def get_index_version(
+                collection: str,
+                name: str | None = None
+            ) -> int | None:
+        """
+        Retrieves the version of an index a collection holds
+
+        Parameters
+        ----------
+        collection : str
+            The collection (e.g. `faculty_v3_1a2b3c4d`)
+        name : str | None, default=None
+            The name of the index the collection must belong to. Any index
+            is accepted if None
+
+        Returns
+        -------
+        int | None
+            The version (e.g. 3), or None if the collection is not a version
+            of the index
+        """
+        # Versions built before build ids were added have none
+        match = re.fullmatch(r"(.+)_v(\d+)(?:_[0-9a-f]+)?", collection)
+        if match is None or (name is not None and match[1] != name):
+            return None
+
+        return int(match[2])
+
+    @staticmethod
+    def get_index_data_dir(collection: str) -> str:
+        """
+        Retrieves the directory the files built alongside a version of an
+        index (see `index_files.IndexFile`) are stored in
+
+        Parameters
+        ----------
+        collection : str
+            The collection the version is stored in
+
+        Returns
+        -------
+        str
+            The directory, `INDEX_DATA/<DB_NAME>/<collection>`
+        """
+        return os.path.join(DBCon.INDEX_DATA, DBCon.DB_NAME, collection)
+
+    @staticmethod
+    def get_department_index(department: str) -> str:
+        """
+        Retrieves the name of the index (shard) of a department
+
+        Parameters
+        ----------
+        department : str
+            The department (e.g. `bio`)
+
+        Returns
+        -------
+        str
+            The name of the department's index (e.g. `faculty_bio`)
+        """
+        return f"{DBCon.INDEX_NAME}_{department}"
+
+    @staticmethod
+    def get_hash_index(shard: int, num_shards: int) -> str:
+        """
+        Retrieves the name of one of num_shards hash-partitioned indices
+
+        Parameters
+        ----------
+        shard : int
+            The shard, from 0 to num_shards - 1
+        num_shards : int
+            The total number of shards
+
+        Returns
+        -------
+        str
+            The name of the shard's index (e.g. `faculty_hash0of4`)
+        """
+        return f"{DBCon.INDEX_NAME}_hash{shard}of{num_shards}"
+
+    @staticmethod
+    def get_shards(num_shards: int | None = None) -> list[str]:
+        """
+        Retrieves the name of every published shard of one partitioning
+        scheme: either every department index, or every index of num_shards
+        hash shards. Hash shards never share a page, but a page crawled from
+        more than one department's seed is in each of their shards
+
+        Parameters
+        ----------
+        num_shards : int | None, default=None
+            If given, the hash shards built with this many shards are
+            retrieved (see `get_hash_index`), otherwise the department shards
+            are (see `get_department_index`)
+
+        Returns
+        -------
+        list[str]
+            The name of every shard, sorted
+        """
+        db = DBCon.get_db()
+        prefix = f"{DBCon.INDEX_NAME}_"
+
+        shards: list[str] = []
+        for pointer in db[DBCon.INDEX_POINTERS].find():
+            name = pointer['_id']
+            if not name.startswith(prefix) or ':' in name:
+                continue
+
+            if DBCon.get_num_shards(name) == num_shards:
+                shards.append(name)
+
+        return sorted(shards)
+
+    @staticmethod
+    def get_num_shards(shard: str) -> int | None:
+        """
+        Retrieves how many hash shards the index of a hash shard was built
+        alongside
+
+        Parameters
+        ----------
+        shard : str
+            The name of the shard's index (e.g. `faculty_hash0of4`)
+
+        Returns
+        -------
+        int | None
+            The number of hash shards (e.g. 4), or None if the index is not
+            a hash shard (e.g. a department's)
+        """
+        match = re.fullmatch(
+            rf"{re.escape(DBCon.INDEX_NAME)}_hash\d+of(\d+)", shard
+        )
+        return int(match[1]) if match else None
+
+    @staticmethod
+    def get_shard_files_index(shards: list[str]) -> str:
+        """
+        Retrieves the name of the index whose files (vocabulary and spelling
+        index) are shared by every shard of a partitioning scheme (see
+        `indexer.index_shard_files`)
+
+        Parameters
+        ----------
+        shards : list[str]
+            Shards of one scheme: department shards, or the hash shards of
+            one number of shards. An empty list means department shards
+
+        Returns
+        -------
+        str
+            The name of the index (e.g. `faculty-departments`, or
+            `faculty-hash4`), which `get_shards` never returns
+
+        Raises
+        ------
+        ValueError
+            if the shards are of more than one scheme
+        """
+        schemes = {DBCon.get_num_shards(shard) for shard in shards}
+        if len(schemes) > 1:
+            raise ValueError(
+                "Shards of more than one partitioning scheme can't be " +
+                "searched together."
+            )
+
+        num_shards = schemes.pop() if schemes else None
+        if num_shards is None:
+            return f"{DBCon.INDEX_NAME}-departments"
+        return f"{DBCon.INDEX_NAME}-hash{num_shards}"
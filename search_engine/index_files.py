@@ -0,0 +1,227 @@
+import os
+from abc import ABC, abstractmethod
+from threading import Lock, Thread
+from typing import TypeVar
+
+from .database import DBCon
+
+T = TypeVar("T", bound="IndexFile")
+
+
+class IndexFile(ABC):
+    """
+    A file built alongside each version of an index, such as the vocabulary
+    or the spelling index, of which one static instance per index (that of
+    its active version) is kept in memory for queries to use
+
+    Subclasses set FILENAME and implement `empty()`, `load()`, and `save()`.
+
+    When a new version is published, `get()` keeps handing out the previous
+    instance while the new one is loaded in the background, so queries never
+    wait on a (re)load. Only the very first load, when there is no previous
+    instance, happens on the calling thread
+    """
+
+    # The name of the file within the directory of its index version
+    # (see `DBCon.get_index_data_dir`)
+    FILENAME: str
+
+    # Index name -> the static instance (see `get()`) and the collection it
+    # was built alongside. Every subclass has its own
+    INSTANCES: dict[str, tuple["IndexFile", str]]
+    # Index name -> the collection being loaded in the background
+    WARMING: dict[str, str]
+
+    # Guards swapping instances
+    LOCK = Lock()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.INSTANCES = {}
+        cls.WARMING = {}
+
+    @classmethod
+    @abstractmethod
+    def empty(cls: type[T]) -> T:
+        """
+        Retrieves an instance with nothing in it
+
+        Returns
+        -------
+        T
+            The empty instance
+        """
+
+    @classmethod
+    @abstractmethod
+    def load(cls: type[T], path: str) -> T:
+        """
+        Loads an instance saved with `save()`
+
+        Parameters
+        ----------
+        path : str
+            The file to load from
+
+        Returns
+        -------
+        T
+            The loaded instance
+        """
+
+    @abstractmethod
+    def save(self, path: str) -> None:
+        """
+        Saves the instance to a file
+
+        Parameters
+        ----------
+        path : str
+            The file to save to
+        """
+
+    @classmethod
+    def path(cls, collection: str) -> str:
+        """
+        Retrieves where the file of an index version is stored
+
+        Parameters
+        ----------
+        collection : str
+            The collection the index version is stored in
+
+        Returns
+        -------
+        str
+            The path of the file
+        """
+        return os.path.join(
+            DBCon.get_index_data_dir(collection), cls.FILENAME
+        )
+
+    @classmethod
+    def read(cls: type[T], collection: str) -> T:
+        """
+        Loads the instance of an index version, if it was built
+
+        Parameters
+        ----------
+        collection : str
+            The collection the index version is stored in
+
+        Returns
+        -------
+        T
+            The loaded instance, or an empty one if there is no file
+        """
+        path = cls.path(collection)
+        if os.path.exists(path):
+            return cls.load(path)
+
+        return cls.empty()
+
+    @classmethod
+    def get(cls: type[T], name: str | None = None) -> T:
+        """
+        Retrieves the static instance of the active version of an index. If
+        a newer version has been published, it is loaded in the background
+        and the current instance is returned until it is ready
+
+        Parameters
+        ----------
+        name : str | None, default=None
+            The name of the index. DBCon.INDEX_NAME is used if None
+
+        Returns
+        -------
+        T
+            The static instance, which is empty if nothing has been indexed
+        """
+        name = name or DBCon.INDEX_NAME
+        collection = DBCon.get_index_collection(name)
+
+        cached = cls.INSTANCES.get(name)
+        if cached is None:
+            instance = cls.read(collection)
+            cls.install(instance, collection, name)
+            return instance
+
+        instance, instance_collection = cached
+        if instance_collection != collection:
+            cls.warm(collection, name)
+
+        assert isinstance(instance, cls)
+        return instance
+
+    @classmethod
+    def install(
+                cls,
+                instance: "IndexFile",
+                collection: str,
+                name: str | None = None
+            ) -> None:
+        """
+        Makes an instance the static one of an index, e.g. one that was just
+        built, so that it does not have to be loaded back from disk
+
+        Parameters
+        ----------
+        instance : IndexFile
+            The instance
+        collection : str
+            The collection of the index version it belongs to
+        name : str | None, default=None
+            The name of the index. DBCon.INDEX_NAME is used if None
+        """
+        name = name or DBCon.INDEX_NAME
+        with IndexFile.LOCK:
+            cls.INSTANCES[name] = (instance, collection)
+            cls.WARMING.pop(name, None)
+
+    @classmethod
+    def warm(cls, collection: str, name: str | None = None) -> None:
+        """
+        Loads the instance of an index version on a background thread, then
+        makes it the static one of its index. Does nothing if it is already
+        being loaded
+
+        Parameters
+        ----------
+        collection : str
+            The collection of the index version to load
+        name : str | None, default=None
+            The name of the index. DBCon.INDEX_NAME is used if None
+        """
+        name = name or DBCon.INDEX_NAME
+        with IndexFile.LOCK:
+            if cls.WARMING.get(name) == collection:
+                return
+            cls.WARMING[name] = collection
+
+        def load_and_install() -> None:
+            try:
+                instance = cls.read(collection)
+            except Exception:
+                # Let the next `get()` try again
+                with IndexFile.LOCK:
+                    if cls.WARMING.get(name) == collection:
+                        del cls.WARMING[name]
+                raise
+
+            with IndexFile.LOCK:
+                # Another version may have been installed in the meantime
+                if cls.WARMING.get(name) != collection:
+                    return
+                cls.INSTANCES[name] = (instance, collection)
+                del cls.WARMING[name]
+
+        Thread(target=load_and_install, daemon=True).start()
+
+    @classmethod
+    def reset(cls) -> None:
+        """
+        Forgets every static instance, so the next `get()` loads it again
+        """
+        with IndexFile.LOCK:
+            cls.INSTANCES.clear()
+            cls.WARMING.clear()
@@ -1,16 +1,62 @@
+import heapq
+import json
+import os
+import shutil
+import sys
+import zlib
 from collections import defaultdict
+from itertools import groupby
+from tempfile import TemporaryDirectory
+from typing import Iterator
+
+from scipy.sparse import csr_matrix, vstack
 
 from .database import DBCon
+from .lsa import LatentSemanticIndex
 from .parser import retrieve_faculty_data, retrieve_soup
+from .spelling import SpellingIndex
+from .vocabulary import Vocabulary
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore
+
+# The default memory budget of a single block of postings, in bytes
+MEMORY_BUDGET = 64 * 2 ** 20
+# Roughly how many bytes a new term (its dict entry and empty set) and a new
+# posting (a set entry pointing at an existing URL string) cost on top of
+# the term string itself
+TERM_OVERHEAD = 300
+POSTING_OVERHEAD = 40
+# How many inverted indices to send to MongoDB at once
+STORE_BATCH_SIZE = 1000
 
 
-def index_faculty_content(num_targets: int, n_gram: int = 3) -> None:
+def index_faculty_content(
+            num_targets: int,
+            n_gram: int = 3,
+            memory_budget: int = MEMORY_BUDGET,
+            spill_dir: str | None = None,
+            lsa_components: int | None = None,
+            department: str | None = None,
+            hash_shard: tuple[int, int] | None = None
+        ) -> None:
     """
     Calculates the inverted indices for num_targets targets found via a
     MongoDB query for 1-n_gram sets of tokens
 
     An inverted index is essentially a list of documents in
-    which the term occurs.
+    which the term occurs. The vocabulary of every term indexed (used for
+    autocompletion) is saved alongside, as is a spelling index of every word
+    (used to correct query terms). Shards only save their vocabulary, which
+    `index_shard_files` merges into the files every shard shares.
+
+    Every run builds a new version of the index in its own (shadow)
+    collection, so queries keep reading the previous version, untouched,
+    until the new one is complete. The new version is then published with a
+    single atomic pointer update, and versions that are no longer needed
+    are dropped (see `DBCon.begin_index_build` and `DBCon.publish_index`).
 
     We end up with the following schema:
     {
@@ -19,6 +65,18 @@ def index_faculty_content(num_targets: int, n_gram: int = 3) -> None:
         ...
     }
 
+    The indices are built in blocks (single-pass in-memory indexing, SPIMI),
+    so they never all have to fit in memory at once: postings are collected
+    until they take up roughly memory_budget bytes, at which point the block
+    is sorted by term and spilled to a run on disk. Once every target is
+    processed, the runs are merged term by term straight into MongoDB, and
+    the vocabulary is streamed to disk as they are.
+
+    Only the postings (and the vocabulary) are bounded this way. The
+    spelling index holds every single-word term in memory, and the latent
+    semantic index (if built) the hashed term counts of every target, so
+    memory still grows with the number of distinct words and targets
+
     Parameters
     ----------
     num_targets : int
@@ -28,30 +86,363 @@ def index_faculty_content(num_targets: int, n_gram: int = 3) -> None:
         Example: "cats love dogs". 1-gram would index "cats", 2-gram would
         index "cats" and "cats love", 3-gram would index "cats", "cats love",
         and "cats love dogs"
+    memory_budget : int, default=MEMORY_BUDGET
+        Roughly how many bytes of postings to hold in memory before spilling
+        them to disk
+    spill_dir : str | None, default=None
+        The directory to create the temporary directory of runs in. The
+        system's default temporary directory is used if None
+    lsa_components : int | None, default=None
+        If given, a latent semantic index with this many dimensions is also
+        built (see `lsa.LatentSemanticIndex`), for `ranker.rank_lsa`. Only
+        the unsharded index can have one
+    department : str | None, default=None
+        If given, only the targets crawled from this department's seed are
+        indexed, into the department's own index (see
+        `DBCon.get_department_index`)
+    hash_shard : tuple[int, int] | None, default=None
+        If given as (shard, num_shards), only the targets whose URL hashes
+        to shard are indexed, into that shard's own index (see
+        `get_hash_shard` and `DBCon.get_hash_index`). Can't be combined
+        with department
+    """
+    if department is not None and hash_shard is not None:
+        raise ValueError("An index can't be sharded both ways at once.")
+    if lsa_components is not None and (
+                department is not None or hash_shard is not None
+            ):
+        raise ValueError(
+            "A latent semantic index can't be built for a shard."
+        )
+
+    if department is not None:
+        name = DBCon.get_department_index(department)
+    elif hash_shard is not None:
+        name = DBCon.get_hash_index(*hash_shard)
+    else:
+        name = DBCon.INDEX_NAME
+
+    collection = DBCon.begin_index_build(name)
+
+    with TemporaryDirectory(dir=spill_dir) as run_dir:
+        run_paths: list[str] = []
+
+        # The current block of inverted indices
+        # term: set of URLs in which that term occurs
+        # Use a defaultdict so when we first encounter a new term, an empty
+        # set is created
+        block: dict[str, set[str]] = defaultdict(set)
+        block_bytes = 0
+
+        # The URL and (hashed) term counts of each target, for the latent
+        # semantic index
+        lsa_urls: list[str] = []
+        lsa_rows: list[csr_matrix] = []
+
+        # Calculate the indices, spilling a run whenever the block is full
+        targets = DBCon.get_targets(num_targets, department)
+        for target in targets:
+            url, html = target['url'], target['html']
+            if hash_shard is not None:
+                shard, num_shards = hash_shard
+                if get_hash_shard(url, num_shards) != shard:
+                    continue
+            tokens = retrieve_faculty_data(retrieve_soup(html))
+
+            target_terms: list[str] = []
+            for curr_gram in range(1, n_gram + 1):
+                terms = get_grams(tokens, curr_gram)
+                if lsa_components is not None:
+                    target_terms += terms
+
+                for term in terms:
+                    doc_list = block[term]
+                    if not doc_list:
+                        block_bytes += TERM_OVERHEAD + len(term)
+                    if url not in doc_list:
+                        doc_list.add(url)
+                        block_bytes += POSTING_OVERHEAD
+
+            if lsa_components is not None:
+                lsa_urls.append(url)
+                lsa_rows.append(LatentSemanticIndex.count_terms(target_terms))
+
+            if block_bytes >= memory_budget:
+                run_paths.append(write_run(block, run_dir, len(run_paths)))
+                block = defaultdict(set)
+                block_bytes = 0
+
+        if block:
+            run_paths.append(write_run(block, run_dir, len(run_paths)))
+        del block
+
+        # Merge the runs, storing the indices and streaming the vocabulary
+        # to disk as we go. Only the single-word terms are kept in memory,
+        # for the spelling index (which shards share, and don't build)
+        word_terms: list[str] = []
+        word_doc_freqs: list[int] = []
+
+        def store_merged_runs() -> Iterator[tuple[str, int]]:
+            batch: list[tuple[str, list[str]]] = []
+            for term, doc_list in merge_runs(run_paths):
+                if name == DBCon.INDEX_NAME and ' ' not in term:
+                    word_terms.append(term)
+                    word_doc_freqs.append(len(doc_list))
+
+                batch.append((term, doc_list))
+                if len(batch) >= STORE_BATCH_SIZE:
+                    DBCon.store_inverted_indices(batch, collection)
+                    batch = []
+
+                yield term, len(doc_list)
+
+            if batch:
+                DBCon.store_inverted_indices(batch, collection)
+
+        num_terms = Vocabulary.write_entries(
+            Vocabulary.path(collection), store_merged_runs()
+        )
+
+    if name == DBCon.INDEX_NAME:
+        spelling = SpellingIndex(word_terms, word_doc_freqs)
+        spelling.save(SpellingIndex.path(collection))
+
+    if lsa_components is not None:
+        lsa = LatentSemanticIndex.build(
+            lsa_urls,
+            vstack(lsa_rows, format="csr") if lsa_rows
+            else csr_matrix((0, LatentSemanticIndex.N_FEATURES)),
+            lsa_components
+        )
+        del lsa_rows
+        lsa.save(LatentSemanticIndex.path(collection))
+        print(
+            f"{len(lsa.urls):,} targets embedded in " +
+            f"{lsa.embeddings.shape[1]} dimensions."
+        )
+
+    # Swap the new version in, and clean up the ones no longer needed
+    dropped = DBCon.publish_index(collection, name)
+    for old_collection in dropped:
+        shutil.rmtree(
+            DBCon.get_index_data_dir(old_collection), ignore_errors=True
+        )
+
+    if collection in dropped:
+        print(
+            f"A newer version of {name} was published during the build, " +
+            f"so {collection} was dropped."
+        )
+        return
+
+    # Queries made by this process can use what was just built right away,
+    # rather than loading it back from disk (the vocabulary is only on disk)
+    if name == DBCon.INDEX_NAME:
+        SpellingIndex.install(spelling, collection)
+        if lsa_components is not None:
+            LatentSemanticIndex.install(lsa, collection)
+
+    print(
+        f"{num_terms:,} terms indexed from {len(run_paths)} run(s) " +
+        f"into {collection}."
+    )
+    if (peak_rss := get_peak_rss()) is not None:
+        # This covers the whole process (e.g. a crawl run beforehand), not
+        # just this build
+        print(f"Process peak RSS so far: {peak_rss / 2 ** 20:,.1f}MiB.")
+
+
+def index_shard_files(num_shards: int | None = None) -> None:
+    """
+    Builds the vocabulary and spelling index shared by every published shard
+    of a partitioning scheme (see `DBCon.get_shards`), so that queries
+    across shards are corrected and autocompleted like unsharded ones. Run
+    this after (re)building any of the shards
+
+    The vocabularies of the shards are merged term by term, summing the
+    document frequencies of terms found in more than one shard (a page in
+    more than one department's shard is counted once per shard). The result
+    is published as a version of the scheme's own index (see
+    `DBCon.get_shard_files_index`), whose collection holds no postings
+
+    Parameters
+    ----------
+    num_shards : int | None, default=None
+        If given, the files of the hash shards built with this many shards
+        are built, otherwise those of the department shards are
+    """
+    shards = DBCon.get_shards(num_shards)
+    if not shards:
+        print("No shards to build the shared files of.")
+        return
+
+    name = DBCon.get_shard_files_index(shards)
+    collection = DBCon.begin_index_build(name)
+
+    vocabulary_paths = [
+        path for shard in shards
+        if os.path.exists(
+            path := Vocabulary.path(DBCon.get_index_collection(shard))
+        )
+    ]
+    merged = heapq.merge(
+        *(Vocabulary.read_entries(path) for path in vocabulary_paths),
+        key=lambda x: x[0]
+    )
+
+    # Stream the merged vocabulary to disk, keeping only the single-word
+    # terms in memory, for the spelling index
+    word_terms: list[str] = []
+    word_doc_freqs: list[int] = []
+
+    def merge_vocabularies() -> Iterator[tuple[str, int]]:
+        for term, group in groupby(merged, key=lambda x: x[0]):
+            doc_freq = sum(shard_doc_freq for _, shard_doc_freq in group)
+            if ' ' not in term:
+                word_terms.append(term)
+                word_doc_freqs.append(doc_freq)
+
+            yield term, doc_freq
+
+    num_terms = Vocabulary.write_entries(
+        Vocabulary.path(collection), merge_vocabularies()
+    )
+
+    spelling = SpellingIndex(word_terms, word_doc_freqs)
+    spelling.save(SpellingIndex.path(collection))
+
+    dropped = DBCon.publish_index(collection, name)
+    for old_collection in dropped:
+        shutil.rmtree(
+            DBCon.get_index_data_dir(old_collection), ignore_errors=True
+        )
+
+    if collection in dropped:
+        print(
+            f"A newer version of {name} was published during the build, " +
+            f"so {collection} was dropped."
+        )
+        return
+
+    SpellingIndex.install(spelling, collection, name)
+    print(
+        f"{num_terms:,} terms of {len(shards)} shard(s) merged " +
+        f"into {collection}."
+    )
+
+
+def get_hash_shard(url: str, num_shards: int) -> int:
+    """
+    Retrieves the shard a URL belongs to when the index is partitioned into
+    num_shards shards by hash (stable across runs, unlike `hash()`)
+
+    Parameters
+    ----------
+    url : str
+        The URL of the target
+    num_shards : int
+        The total number of shards
+
+    Returns
+    -------
+    int
+        The shard, from 0 to num_shards - 1
+    """
+    return zlib.crc32(url.encode()) % num_shards
+
+
+def write_run(block: dict[str, set[str]], run_dir: str, run: int) -> str:
+    """
+    Spills a block of inverted indices to disk, sorted by term, as a run of
+    JSON lines: `["cats love", ["url1", "url2"]]`
+
+    Parameters
+    ----------
+    block : dict[str, set[str]]
+        The block of inverted indices to spill
+    run_dir : str
+        The directory to write the run to
+    run : int
+        The number of the run (used to name the file)
+
+    Returns
+    -------
+    str
+        The path of the run written
+    """
+    path = os.path.join(run_dir, f"run-{run:05}.jsonl")
+    with open(path, "w", encoding="utf-8") as file:
+        for term in sorted(block):
+            file.write(json.dumps([term, sorted(block[term])]) + "\n")
+
+    return path
+
+
+def read_run(path: str) -> Iterator[tuple[str, list[str]]]:
+    """
+    Reads back a run written by `write_run()`, one inverted index at a time
+
+    Parameters
+    ----------
+    path : str
+        The path of the run
+
+    Yields
+    ------
+    tuple[str, list[str]]
+        Each term and the URLs it occurs in, in order of term
+    """
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            term, doc_list = json.loads(line)
+            yield term, doc_list
+
+
+def merge_runs(run_paths: list[str]) -> Iterator[tuple[str, list[str]]]:
     """
-    # The final map of inverted indices
-    # term: set of URLs in which that term occurs
-    # Use a defaultdict so when we first encounter a new term, an empty set
-    # is created
-    inverted_indices: dict[str, set[str]] = defaultdict(set)
+    k-way merges sorted runs, combining the postings of terms found in more
+    than one run. Only one inverted index per run is held in memory at a time
+
+    Parameters
+    ----------
+    run_paths : list[str]
+        The paths of the runs to merge
 
-    # Calculate the indices
-    targets = DBCon.get_targets(num_targets)
-    for target in targets:
-        url, html = target['url'], target['html']
-        tokens = retrieve_faculty_data(retrieve_soup(html))
+    Yields
+    ------
+    tuple[str, list[str]]
+        Each term and every URL it occurs in (sorted), in order of term
+    """
+    merged = heapq.merge(
+        *(read_run(path) for path in run_paths), key=lambda x: x[0]
+    )
 
-        for curr_gram in range(1, n_gram + 1):
-            terms = get_grams(tokens, curr_gram)
+    for term, group in groupby(merged, key=lambda x: x[0]):
+        doc_lists = [doc_list for _, doc_list in group]
+        if len(doc_lists) == 1:
+            yield term, doc_lists[0]
+        else:
+            yield term, sorted(set().union(*doc_lists))
 
-            for term in terms:
-                inverted_indices[term].add(url)
 
-    # Store the indices
-    for term, doc_list in inverted_indices.items():
-        DBCon.store_inverted_index(term, doc_list)
+def get_peak_rss() -> int | None:
+    """
+    Retrieves the peak resident set size (memory actually held in RAM) of
+    this process over its whole lifetime so far. This is not reset between
+    phases, so it only reflects a single phase if that phase used the most
+
+    Returns
+    -------
+    int | None
+        The peak RSS in bytes, or None if it can't be measured on this
+        platform
+    """
+    if resource is None:
+        return None
 
-    print(f"{len(inverted_indices.keys()):,} terms indexed.")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, everything else reports kilobytes
+    return peak if sys.platform == "darwin" else peak * 1024
 
 
 def get_grams(tokens: list[str], gram: int = 1) -> list[str]:
@@ -0,0 +1,318 @@
+import os
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import (
+    HashingVectorizer, TfidfTransformer
+)
+
+from .index_files import IndexFile
+
+
+class LatentSemanticIndex(IndexFile):
+    """
+    A latent semantic index (LSA) of every target: the TF-IDF matrix of the
+    targets' n-grams, reduced with a truncated SVD to around a hundred dense
+    "concept" dimensions. Related terms (e.g. "ecology" and "ecosystem") end
+    up close together in that space even when they never share an n-gram
+
+    Terms are hashed into a fixed feature space (see `count_terms`), so each
+    target can be counted as soon as it is tokenized, into one small sparse
+    row, without keeping its terms or a vocabulary around until the end of
+    indexing
+
+    Document embeddings are kept in one contiguous float32 array, so a query
+    is answered with a single matrix-vector product, without fetching or
+    re-tokenizing any pages
+    """
+
+    # The index built at index time is stored alongside the other files of
+    # the same index version (see `IndexFile.path()`)
+    FILENAME = "lsa.npz"
+
+    # The number of dimensions documents are reduced to
+    N_COMPONENTS = 100
+    # The number of features terms are hashed into. Large enough that few
+    # terms of a faculty site collide
+    N_FEATURES = 2 ** 20
+    # The most features to keep (the most frequent ones), which bounds the
+    # size of the components matrix
+    MAX_FEATURES = 50_000
+
+    # Hashes terms (documents are already split into terms) into term counts
+    HASHER = HashingVectorizer(
+        analyzer=lambda terms: terms,
+        n_features=N_FEATURES,
+        alternate_sign=False,
+        norm=None,
+        dtype=np.float32
+    )
+
+    def __init__(
+                self,
+                urls: list[str],
+                features: np.ndarray,
+                idf: np.ndarray,
+                components: np.ndarray,
+                embeddings: np.ndarray
+            ) -> None:
+        """
+        Parameters
+        ----------
+        urls : list[str]
+            The URL of each document, such that urls[i] belongs to
+            embeddings[i]
+        features : np.ndarray
+            The hashed feature (see `count_terms`) of each column of
+            components, sorted, shape (features,)
+        idf : np.ndarray
+            The inverse document frequency of each feature, shape (features,)
+        components : np.ndarray
+            The SVD components, shape (dimensions, features)
+        embeddings : np.ndarray
+            The unit-length embedding of each document,
+            shape (documents, dimensions)
+        """
+        self.urls = urls
+        self.features = np.ascontiguousarray(features, dtype=np.int64)
+        self.idf = np.ascontiguousarray(idf, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    @staticmethod
+    def empty() -> "LatentSemanticIndex":
+        """
+        Retrieves an index with no documents
+
+        Returns
+        -------
+        LatentSemanticIndex
+            The empty index
+        """
+        return LatentSemanticIndex(
+            [], np.zeros(0), np.zeros(0), np.zeros((0, 0)), np.zeros((0, 0))
+        )
+
+    @staticmethod
+    def count_terms(terms: list[str]) -> csr_matrix:
+        """
+        Counts terms into a row of the (hashed) feature space
+
+        Parameters
+        ----------
+        terms : list[str]
+            The terms (every n-gram, see `indexer.get_grams`) of a document
+            or query
+
+        Returns
+        -------
+        csr_matrix
+            The term counts, shape (1, N_FEATURES)
+        """
+        return LatentSemanticIndex.HASHER.transform([terms])
+
+    @staticmethod
+    def build(
+                urls: list[str],
+                counts: csr_matrix,
+                n_components: int | None = None
+            ) -> "LatentSemanticIndex":
+        """
+        Builds a latent semantic index over documents
+
+        Parameters
+        ----------
+        urls : list[str]
+            The URL of each document
+        counts : csr_matrix
+            The term counts of each document (see `count_terms`), one row
+            per document, in the same order as urls
+        n_components : int | None, default=None
+            The number of dimensions to reduce documents to (N_COMPONENTS if
+            None). Capped by the number of documents and features
+
+        Returns
+        -------
+        LatentSemanticIndex
+            The index of every document (empty if there are too few
+            documents or features to reduce)
+        """
+        if len(urls) < 2:
+            return LatentSemanticIndex.empty()
+
+        # Only keep the features that occur, and of those, the most frequent
+        totals = np.asarray(counts.sum(axis=0)).ravel()
+        features = np.flatnonzero(totals)
+        if len(features) > LatentSemanticIndex.MAX_FEATURES:
+            top = np.argpartition(
+                -totals[features], LatentSemanticIndex.MAX_FEATURES - 1
+            )[:LatentSemanticIndex.MAX_FEATURES]
+            features = np.sort(features[top])
+
+        transformer = TfidfTransformer()
+        tf_idf_mat = transformer.fit_transform(counts[:, features])
+
+        n_components = min(
+            n_components or LatentSemanticIndex.N_COMPONENTS,
+            tf_idf_mat.shape[0] - 1,
+            tf_idf_mat.shape[1] - 1
+        )
+        if n_components < 1:
+            return LatentSemanticIndex.empty()
+
+        svd = TruncatedSVD(n_components=n_components, random_state=0)
+        embeddings = svd.fit_transform(tf_idf_mat)
+
+        return LatentSemanticIndex(
+            urls,
+            features,
+            transformer.idf_,
+            svd.components_,
+            normalize_rows(embeddings)
+        )
+
+    def save(self, path: str) -> None:
+        """
+        Saves the index to a (NumPy .npz) file
+
+        Parameters
+        ----------
+        path : str
+            The file to save to
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez(
+            path,
+            urls=np.array(self.urls, dtype=str),
+            features=self.features,
+            idf=self.idf,
+            components=self.components,
+            embeddings=self.embeddings
+        )
+
+    @staticmethod
+    def load(path: str) -> "LatentSemanticIndex":
+        """
+        Loads an index saved with `save()`
+
+        Parameters
+        ----------
+        path : str
+            The file to load from
+
+        Returns
+        -------
+        LatentSemanticIndex
+            The loaded index
+        """
+        with np.load(path) as data:
+            return LatentSemanticIndex(
+                data["urls"].tolist(),
+                data["features"],
+                data["idf"],
+                data["components"],
+                data["embeddings"]
+            )
+
+    def embed(self, terms: list[str]) -> np.ndarray | None:
+        """
+        Projects terms into the latent space, the same way the documents were
+
+        Parameters
+        ----------
+        terms : list[str]
+            The terms (every n-gram) of a query
+
+        Returns
+        -------
+        np.ndarray | None
+            The unit-length embedding of the terms, or None if none of them
+            were indexed
+        """
+        if not len(self.features):
+            return None
+
+        counts = LatentSemanticIndex.count_terms(terms)
+
+        # Find the column of each of the query's features, if it was kept
+        columns = np.minimum(
+            np.searchsorted(self.features, counts.indices),
+            len(self.features) - 1
+        )
+        found = self.features[columns] == counts.indices
+        if not found.any():
+            return None
+
+        columns = columns[found]
+        tf_idf = counts.data[found] * self.idf[columns]
+        tf_idf /= np.linalg.norm(tf_idf)
+
+        embedding = self.components[:, columns] @ tf_idf
+        norm = np.linalg.norm(embedding)
+
+        return embedding / norm if norm > 0 else None
+
+    def search(
+                self,
+                terms: list[str],
+                k: int
+            ) -> tuple[list[tuple[str, float]], int]:
+        """
+        Retrieves the k documents closest to a query's terms in the latent
+        space (by cosine similarity)
+
+        Parameters
+        ----------
+        terms : list[str]
+            The terms (every n-gram) of a query
+        k : int
+            The maximum number of documents to retrieve
+
+        Returns
+        -------
+        tuple[list[tuple[str, float]], int]
+            The URLs of the closest documents and their cosine similarities,
+            most similar first, and the total number of documents found (how
+            many are similar at all, which may be more than k). Documents
+            that are not similar at all are left out
+        """
+        if not self.urls or k < 1:
+            return [], 0
+
+        embedding = self.embed(terms)
+        if embedding is None:
+            return [], 0
+
+        similarity = self.embeddings @ embedding
+        num_found = int(np.count_nonzero(similarity > 0))
+
+        k = min(k, len(similarity))
+        top = np.argpartition(-similarity, k - 1)[:k]
+        top = top[np.argsort(-similarity[top])]
+
+        return [
+            (self.urls[i], float(similarity[i]))
+            for i in top
+            if similarity[i] > 0
+        ], num_found
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    Scales every row of a matrix to unit length (rows of all zeros are left
+    as they are)
+
+    Parameters
+    ----------
+    matrix : np.ndarray
+        The matrix to normalize
+
+    Returns
+    -------
+    np.ndarray
+        The normalized matrix
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return matrix / norms
@@ -0,0 +1,448 @@
+import json
+from bisect import bisect_left
+from contextlib import nullcontext
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any, Callable, ContextManager, ParamSpec, TypeVar
+
+P = ParamSpec("P")
+R = TypeVar("R")
+
+# A metric is identified by its name and its (sorted) labels
+MetricKey = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Retrieves the q-th percentile of a list of values (nearest-rank)
+
+    Parameters
+    ----------
+    values : list[float]
+        The values to take the percentile of
+    q : float
+        The percentile, between 0 and 1
+
+    Returns
+    -------
+    float
+        The percentile, or 0 if there are no values
+    """
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    return ordered[round(q * (len(ordered) - 1))]
+
+
+class Histogram:
+    """
+    A cumulative histogram of observed values, alongside their count, sum,
+    minimum, and maximum
+    """
+
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        """
+        Parameters
+        ----------
+        buckets : tuple[float, ...]
+            The (sorted) upper bounds of each bucket. An implicit +Inf bucket
+            catches anything larger
+        """
+        self.buckets = buckets
+        self.bucket_counts: list[int] = [0] * (len(buckets) + 1)
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.min: float = float("inf")
+        self.max: float = float("-inf")
+
+    def observe(self, value: float) -> None:
+        """
+        Records a value
+
+        Parameters
+        ----------
+        value : float
+            The value to record
+        """
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def cumulative_counts(self) -> list[tuple[str, int]]:
+        """
+        Retrieves the number of values less than or equal to each bucket's
+        upper bound
+
+        Returns
+        -------
+        list[tuple[str, int]]
+            Each bucket's upper bound (formatted, with "+Inf" last) and the
+            number of values that fall in or under it
+        """
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+
+        total = 0
+        cumulative: list[tuple[str, int]] = []
+        for bound, count in zip(bounds, self.bucket_counts):
+            total += count
+            cumulative.append((bound, total))
+
+        return cumulative
+
+
+class _Timer:
+    """Observes how long its context took, in seconds, into a histogram"""
+
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: dict[str, str]) -> None:
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        Metrics.observe(self.name, perf_counter() - self.start, **self.labels)
+
+
+class Metrics:
+    """
+    Maintains static counters and histograms for every stage of the program
+    (fetching, parsing, tokenizing, DB reads and writes, and scoring)
+
+    Metrics are disabled by default, in which case every call returns
+    immediately without recording anything. Enable them with
+    `Metrics.enable()`, then export them with `Metrics.snapshot()` (JSON) or
+    `Metrics.to_prometheus()` (Prometheus text), or serve the latter over HTTP
+    with `Metrics.serve(port)`
+    """
+
+    # Whether or not metrics are being recorded
+    ENABLED: bool = False
+
+    # The prefix of every metric name when exported to Prometheus
+    NAMESPACE = "faculty_crawl"
+
+    # The histogram buckets used for durations (seconds) and sizes (bytes)
+    SECONDS_BUCKETS: tuple[float, ...] = (
+        0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+        0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+    )
+    BYTES_BUCKETS: tuple[float, ...] = tuple(
+        float(4 ** power) for power in range(5, 12)
+    )
+
+    COUNTERS: dict[MetricKey, float] = {}
+    HISTOGRAMS: dict[MetricKey, Histogram] = {}
+    LOCK = Lock()
+
+    @staticmethod
+    def enable() -> None:
+        """Starts recording metrics"""
+        Metrics.ENABLED = True
+
+    @staticmethod
+    def disable() -> None:
+        """Stops recording metrics (anything recorded so far is kept)"""
+        Metrics.ENABLED = False
+
+    @staticmethod
+    def reset() -> None:
+        """Forgets every recorded metric"""
+        with Metrics.LOCK:
+            Metrics.COUNTERS.clear()
+            Metrics.HISTOGRAMS.clear()
+
+    @staticmethod
+    def _key(name: str, labels: dict[str, str]) -> MetricKey:
+        """
+        Retrieves the key a metric is stored under
+
+        Parameters
+        ----------
+        name : str
+            The name of the metric
+        labels : dict[str, str]
+            The labels of the metric
+
+        Returns
+        -------
+        MetricKey
+            The name and the sorted labels of the metric
+        """
+        return name, tuple(sorted(labels.items()))
+
+    @staticmethod
+    def inc(name: str, value: float = 1, **labels: str) -> None:
+        """
+        Increments a counter
+
+        Parameters
+        ----------
+        name : str
+            The name of the counter (e.g. `postings_lookups_total`)
+        value : float, default=1
+            The amount to increment by
+        **labels : str
+            Any labels to distinguish this counter by
+        """
+        if not Metrics.ENABLED:
+            return
+
+        key = Metrics._key(name, labels)
+        with Metrics.LOCK:
+            Metrics.COUNTERS[key] = Metrics.COUNTERS.get(key, 0) + value
+
+    @staticmethod
+    def observe(name: str, value: float, **labels: str) -> None:
+        """
+        Records a value into a histogram. Histograms whose name ends with
+        `_bytes` use byte-sized buckets, all others use second-sized buckets
+
+        Parameters
+        ----------
+        name : str
+            The name of the histogram (e.g. `fetch_seconds`)
+        value : float
+            The value to record
+        **labels : str
+            Any labels to distinguish this histogram by
+        """
+        if not Metrics.ENABLED:
+            return
+
+        key = Metrics._key(name, labels)
+        with Metrics.LOCK:
+            histogram = Metrics.HISTOGRAMS.get(key)
+            if histogram is None:
+                histogram = Histogram(
+                    Metrics.BYTES_BUCKETS if name.endswith("_bytes")
+                    else Metrics.SECONDS_BUCKETS
+                )
+                Metrics.HISTOGRAMS[key] = histogram
+
+            histogram.observe(value)
+
+    @staticmethod
+    def timer(name: str, **labels: str) -> ContextManager:
+        """
+        Retrieves a context manager that records how long its body takes, in
+        seconds, into a histogram:
+        ```
+        with Metrics.timer("scoring_seconds"):
+            ...
+        ```
+
+        Parameters
+        ----------
+        name : str
+            The name of the histogram
+        **labels : str
+            Any labels to distinguish this histogram by
+
+        Returns
+        -------
+        ContextManager
+            The timer (or a context manager that does nothing if metrics are
+            disabled)
+        """
+        if not Metrics.ENABLED:
+            return nullcontext()
+
+        return _Timer(name, labels)
+
+    @staticmethod
+    def timed(
+                name: str,
+                **labels: str
+            ) -> Callable[[Callable[P, R]], Callable[P, R]]:
+        """
+        A decorator recording how long every call of a function takes, in
+        seconds, into a histogram
+
+        Parameters
+        ----------
+        name : str
+            The name of the histogram
+        **labels : str
+            Any labels to distinguish this histogram by
+
+        Returns
+        -------
+        Callable[[Callable[P, R]], Callable[P, R]]
+            The decorator
+        """
+        def decorator(func: Callable[P, R]) -> Callable[P, R]:
+            @wraps(func)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                if not Metrics.ENABLED:
+                    return func(*args, **kwargs)
+
+                start = perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    Metrics.observe(name, perf_counter() - start, **labels)
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def snapshot() -> dict[str, dict[str, Any]]:
+        """
+        Retrieves every recorded metric as a JSON-serializable dictionary
+
+        We end up with the following schema:
+        {
+            "counters": {"postings_lookups_total": 12, ...},
+            "histograms": {
+                "db_read_seconds{op=get_page}": {
+                    "count": 3, "sum": 0.01, "min": ..., "max": ...,
+                    "mean": ..., "buckets": {"0.0001": 0, ..., "+Inf": 3}
+                },
+                ...
+            }
+        }
+
+        Returns
+        -------
+        dict[str, dict[str, Any]]
+            The counters and histograms recorded
+        """
+        def format_key(key: MetricKey) -> str:
+            name, labels = key
+            if not labels:
+                return name
+            return name + "{" + ','.join(f"{k}={v}" for k, v in labels) + "}"
+
+        with Metrics.LOCK:
+            return {
+                "counters": {
+                    format_key(key): value
+                    for key, value in Metrics.COUNTERS.items()
+                },
+                "histograms": {
+                    format_key(key): {
+                        "count": histogram.count,
+                        "sum": histogram.sum,
+                        "min": histogram.min,
+                        "max": histogram.max,
+                        "mean": histogram.sum / histogram.count,
+                        "buckets": dict(histogram.cumulative_counts()),
+                    }
+                    for key, histogram in Metrics.HISTOGRAMS.items()
+                },
+            }
+
+    @staticmethod
+    def write_json(path: str) -> None:
+        """
+        Writes a snapshot of every recorded metric to a JSON file
+
+        Parameters
+        ----------
+        path : str
+            The file to write to
+        """
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(Metrics.snapshot(), file, indent=2)
+
+    @staticmethod
+    def to_prometheus() -> str:
+        """
+        Retrieves every recorded metric in the Prometheus text exposition
+        format
+
+        Returns
+        -------
+        str
+            The metrics, one sample per line
+        """
+        def format_labels(
+                    labels: tuple[tuple[str, str], ...],
+                    extra: tuple[tuple[str, str], ...] = ()
+                ) -> str:
+            labels = labels + extra
+            if not labels:
+                return ""
+            return "{" + ','.join(f'{k}="{v}"' for k, v in labels) + "}"
+
+        lines: list[str] = []
+        typed: set[str] = set()
+
+        with Metrics.LOCK:
+            for (name, labels), value in sorted(Metrics.COUNTERS.items()):
+                name = f"{Metrics.NAMESPACE}_{name}"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{format_labels(labels)} {value:g}")
+
+            for (name, labels), histogram in sorted(
+                        Metrics.HISTOGRAMS.items(), key=lambda item: item[0]
+                    ):
+                name = f"{Metrics.NAMESPACE}_{name}"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+
+                for bound, count in histogram.cumulative_counts():
+                    bucket_labels = format_labels(labels, (("le", bound),))
+                    lines.append(f"{name}_bucket{bucket_labels} {count}")
+                lines.append(
+                    f"{name}_sum{format_labels(labels)} {histogram.sum:g}"
+                )
+                lines.append(
+                    f"{name}_count{format_labels(labels)} {histogram.count}"
+                )
+
+        return '\n'.join(lines) + "\n"
+
+    @staticmethod
+    def serve(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """
+        Serves the Prometheus text format at `/metrics` in a background thread
+
+        Parameters
+        ----------
+        port : int
+            The port to serve on
+        host : str, default="127.0.0.1"
+            The host to bind to
+
+        Returns
+        -------
+        ThreadingHTTPServer
+            The running server (call `shutdown()` on it to stop serving)
+        """
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = Metrics.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header(
+                    "Content-Type", "text/plain; version=0.0.4; charset=utf-8"
+                )
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        Thread(target=server.serve_forever, daemon=True).start()
+
+        return server
@@ -9,6 +9,8 @@ from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 from nltk.tokenize import word_tokenize
 
+from .metrics import Metrics
+
 # Download the required NLTK data files
 nltk.download('punkt', quiet=True)
 nltk.download('stopwords', quiet=True)
@@ -31,10 +33,14 @@ def fetch_html(url: str) -> BeautifulSoup:
         The retrieved HTML
 
     """
-    html = urlopen(url)
-    return retrieve_soup(html.read())
+    with Metrics.timer("fetch_seconds"):
+        content = urlopen(url).read()
+
+    Metrics.observe("fetch_bytes", len(content))
+    return retrieve_soup(content)
 
 
+@Metrics.timed("parse_seconds")
 def retrieve_soup(html: bytes | str) -> BeautifulSoup:
     """
     Retrieves a BeautifulSoup object based on provided HTML, which can be
@@ -103,6 +109,7 @@ def parse_html(html: BeautifulSoup) -> list[str]:
     return urls
 
 
+@Metrics.timed("tokenize_seconds")
 def preprocess_text(text: str) -> list[str]:
     """
     Preprocesses the text by performing stopword removal and lemmatization.
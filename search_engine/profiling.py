@@ -0,0 +1,239 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from io import StringIO
+from typing import Iterator
+
+# A function as identified by pstats: (filename, line number, function name)
+Function = tuple[str, int, str]
+
+# Where time is spent, grouped by the library a function's file belongs to.
+# The first matching path fragment wins
+LIBRARIES: list[tuple[str, tuple[str, ...]]] = [
+    ("BeautifulSoup", ("/bs4/", "/soupsieve/", "html/parser")),
+    ("NLTK", ("/nltk/",)),
+    ("MongoDB", ("/pymongo/", "/bson/")),
+    ("scikit-learn", ("/sklearn/", "/scipy/", "/numpy/")),
+    ("network", ("/urllib/", "/http/", "/socket", "/ssl")),
+    ("FacultyCrawl", ("/search_engine/",)),
+]
+
+
+@contextmanager
+def profile_phase(
+            name: str,
+            enabled: bool = True,
+            output_dir: str = "profiles",
+            trace_memory: bool = False,
+            top_n: int = 20
+        ) -> Iterator[None]:
+    """
+    Profiles everything run within the context with cProfile (and,
+    optionally, tracemalloc), including any threads it starts, writing the
+    following to output_dir:
+    - `<name>.pstats`, loadable with `pstats` or viewers like snakeviz
+    - `<name>.folded`, collapsed stacks for flamegraph.pl or speedscope
+    - `<name>.txt`, the top_n functions by cumulative time, the time spent
+      in each library (BeautifulSoup, NLTK, MongoDB, ...), and the top_n
+      allocation sites if trace_memory is set
+
+    ```
+    with profile_phase("index", trace_memory=True):
+        index_faculty_content(num_targets, n_grams)
+    ```
+
+    Parameters
+    ----------
+    name : str
+        The name of the phase (used to name the output files)
+    enabled : bool, default=True
+        Whether or not to profile at all. When False the context does nothing
+    output_dir : str, default="profiles"
+        The directory to write the output files to
+    trace_memory : bool, default=False
+        Whether or not to also take a tracemalloc snapshot of the phase
+    top_n : int, default=20
+        The number of functions and allocation sites to report
+    """
+    if not enabled:
+        yield
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, name)
+
+    if trace_memory:
+        tracemalloc.start()
+
+    # Before Python 3.12 a profiler only sees the thread that enabled it, so
+    # every thread started within the context (e.g. the workers ranking a
+    # batch, or querying shards) enables its own, and they are all merged
+    thread_profilers: list[cProfile.Profile] = []
+    if sys.version_info < (3, 12):
+        def profile_thread(*_) -> None:
+            thread_profiler = cProfile.Profile()
+            thread_profilers.append(thread_profiler)
+            thread_profiler.enable()
+
+        threading.setprofile(profile_thread)
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        threading.setprofile(None)
+        snapshot = None
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+
+        stats = pstats.Stats(profiler)
+        for thread_profiler in thread_profilers:
+            stats.add(thread_profiler)
+        stats.dump_stats(path + ".pstats")
+
+        with open(path + ".folded", "w", encoding="utf-8") as file:
+            file.writelines(
+                f"{stack} {value}\n"
+                for stack, value in collapse_stacks(stats).items()
+            )
+
+        report = StringIO()
+        stats.stream = report  # type: ignore
+        stats.sort_stats("cumulative").print_stats(top_n)
+
+        report.write("Time spent per library:\n")
+        total, by_library = time_by_library(stats)
+        for library, seconds in by_library:
+            report.write(
+                f"    {library:<15} {seconds:10.4f}s " +
+                f"({seconds / (total or 1):6.1%})\n"
+            )
+
+        if snapshot is not None:
+            report.write(f"\nTop {top_n} allocation sites:\n")
+            for stat in snapshot.statistics("lineno")[:top_n]:
+                report.write(f"    {stat}\n")
+
+        with open(path + ".txt", "w", encoding="utf-8") as file:
+            file.write(report.getvalue())
+
+        print(f"Profile of {name} written to {path}.(pstats|folded|txt).")
+
+
+def time_by_library(
+            stats: pstats.Stats
+        ) -> tuple[float, list[tuple[str, float]]]:
+    """
+    Totals the time spent inside each library's functions (excluding time
+    spent in the functions they call)
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        The profiling stats to total
+
+    Returns
+    -------
+    tuple[float, list[tuple[str, float]]]
+        The total time profiled and the time spent in each library, most
+        time first. Anything not matched in LIBRARIES is counted as "other"
+    """
+    by_library: dict[str, float] = {}
+    total = 0.0
+
+    entries = stats.stats  # type: ignore
+    for (filename, _, _), (_, _, tt, _, _) in entries.items():
+        library = next(
+            (
+                library
+                for library, fragments in LIBRARIES
+                if any(fragment in filename for fragment in fragments)
+            ),
+            "other"
+        )
+        by_library[library] = by_library.get(library, 0.0) + tt
+        total += tt
+
+    return total, sorted(by_library.items(), key=lambda x: x[1], reverse=True)
+
+
+def collapse_stacks(
+            stats: pstats.Stats,
+            max_depth: int = 64
+        ) -> dict[str, int]:
+    """
+    Converts profiling stats into collapsed ("folded") stacks, the input
+    format of flamegraph.pl and speedscope
+
+    cProfile only records caller -> callee edges, not full stacks, so each
+    function's time is split between its callers in proportion to how much
+    of its time each caller accounted for. The result is an estimate, but an
+    accurate one for the (mostly tree-shaped) call graphs of this program
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        The profiling stats to convert
+    max_depth : int, default=64
+        The deepest stack to follow
+
+    Returns
+    -------
+    dict[str, int]
+        A map of each stack (function labels joined by `;`, outermost first)
+        to the time spent in its innermost function, in microseconds
+    """
+    entries = stats.stats  # type: ignore
+
+    # The functions each function calls
+    callees: dict[Function, list[Function]] = {}
+    for func, (_, _, _, _, callers) in entries.items():
+        for caller in callers:
+            callees.setdefault(caller, []).append(func)
+
+    def label(func: Function) -> str:
+        filename, lineno, funcname = func
+        if filename == "~":
+            return funcname.replace(";", ",")
+        return f"{funcname} ({os.path.basename(filename)}:{lineno})"
+
+    folded: dict[str, int] = {}
+
+    def visit(func: Function, weight: float, stack: list[Function]) -> None:
+        tt = entries[func][2]
+        stack.append(func)
+
+        key = ';'.join(label(frame) for frame in stack)
+        micros = int(tt * weight * 1e6)
+        if micros > 0:
+            folded[key] = folded.get(key, 0) + micros
+
+        if len(stack) < max_depth:
+            for callee in callees.get(func, []):
+                if callee in stack:
+                    continue
+
+                callee_ct = entries[callee][3]
+                edge_ct = entries[callee][4][func][3]
+
+                # Skip paths that account for less than a microsecond
+                if weight * edge_ct < 1e-6:
+                    continue
+
+                visit(callee, weight * edge_ct / callee_ct, stack)
+
+        stack.pop()
+
+    for func, (_, _, _, _, callers) in entries.items():
+        if not callers:
+            visit(func, 1.0, [])
+
+    return folded
@@ -1,14 +1,57 @@
+import heapq
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from math import log
 from time import time
+from typing import TypedDict
 
-from sklearn.feature_extraction.text import TfidfVectorizer
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 
 from .database import DBCon
 from .indexer import get_grams
+from .lsa import LatentSemanticIndex
+from .metrics import Metrics
 from .parser import preprocess_text
+from .spelling import SpellingIndex
+from .vocabulary import Vocabulary
+
+# The most results to retrieve from the latent semantic index for a query
+MAX_LSA_RESULTS = 50
+# The most results to retrieve from each shard (and overall) for a query
+MAX_SHARD_RESULTS = 50
+# The most shards queried at once. Every query shares the same workers, so
+# concurrent queries (e.g. in a batch) don't each start a thread per shard
+MAX_SHARD_WORKERS = 8
+SHARD_EXECUTOR = ThreadPoolExecutor(
+    max_workers=MAX_SHARD_WORKERS, thread_name_prefix="shard"
+)
+
+
+class ShardCandidates(TypedDict):
+    """
+    A TypedDict defining the candidates a shard found for a query
 
-
-def rank(query: str, n_grams: int) -> list[tuple[str, float]]:
+    ShardCandidates have the URL of every candidate (urls : list[str]), the
+    term counts of each candidate (counts : csr_matrix, one row per URL), the
+    term of each column of counts (features : list[str]), and the number of
+    candidates each term occurs in (doc_freqs : np.ndarray)
+    """
+    urls: list[str]
+    counts: csr_matrix
+    features: list[str]
+    doc_freqs: np.ndarray
+
+
+@Metrics.timed("rank_seconds")
+def rank(
+            query: str,
+            n_grams: int,
+            documents_cache: dict[str, str] | None = None
+        ) -> list[tuple[str, float]]:
     """
     Given a user query, return an ordered list of URLs ranked by how similar
     their HTML content is to the request using Cosine Similarity (scikit)
@@ -17,16 +60,22 @@ def rank(query: str, n_grams: int) -> list[tuple[str, float]]:
     ----------
     query : str
         The query provided by the user (this will be pre-processed via
-        the same process used for indexing)
+        the same process used for indexing, and any misspelled words will be
+        corrected to the closest indexed word)
     n_grams : int
         The upper-bound of n-grams to use for TF-IDF calculations
+    documents_cache : dict[str, str] | None, default=None
+        An optional map of URL to its pre-processed document text. When
+        given, pages are only fetched and pre-processed the first time they
+        are seen, which lets many queries (see `batch.batch_query`) share
+        the work
 
     Returns
     -------
     list[tuple[str, float]]
         The ordered list of URLs and their cosine similarities
     """
-    prelim_terms = preprocess_text(query)
+    prelim_terms = correct_terms(preprocess_text(query))
 
     # Query terms will consist of the terms, and any additioanl grams
     query_terms = []
@@ -36,6 +85,7 @@ def rank(query: str, n_grams: int) -> list[tuple[str, float]]:
 
     # Add every document found for every term in the query
     urls = set()
+    Metrics.inc("query_terms_total", len(query_terms))
     for query_term in query_terms:
         inverted_index = DBCon.get_inverted_index(query_term)
         [urls.add(url) for url in inverted_index['doc_list']]
@@ -50,24 +100,25 @@ def rank(query: str, n_grams: int) -> list[tuple[str, float]]:
     ordered_urls: list[str] = []
     documents: list[str] = []
     for url in urls:
-        document = DBCon.get_page(url)
         ordered_urls.append(url)
-        documents.append(' '.join(preprocess_text(document['html'])))
+        documents.append(get_document(url, documents_cache))
 
-    # Calculate TF-IDF features for the documents
-    vectorizer = TfidfVectorizer(
-        stop_words='english', ngram_range=(1, n_grams)
-    )
-    tf_idf_mat = vectorizer.fit_transform(
-        documents + [' '.join(query_terms)]
-    )
+    with Metrics.timer("scoring_seconds"):
+        # Calculate TF-IDF features for the documents
+        vectorizer = TfidfVectorizer(
+            stop_words='english', ngram_range=(1, n_grams)
+        )
+        tf_idf_mat = vectorizer.fit_transform(
+            documents + [' '.join(query_terms)]
+        )
 
-    # Calculate the cosine similarities between the Query and the Documents
-    q_vector = tf_idf_mat.getrow(-1)
-    d_vectors = tf_idf_mat[:-1]  # type: ignore
-    similarity: list[float] = cosine_similarity(
-        q_vector, d_vectors
-    ).flatten().tolist()
+        # Calculate the cosine similarities between the Query and the
+        # Documents
+        q_vector = tf_idf_mat.getrow(-1)
+        d_vectors = tf_idf_mat[:-1]  # type: ignore
+        similarity: list[float] = cosine_similarity(
+            q_vector, d_vectors
+        ).flatten().tolist()
 
     # Rank the URLs by the similarity of their documents
     return sorted(
@@ -77,6 +128,412 @@ def rank(query: str, n_grams: int) -> list[tuple[str, float]]:
     )
 
 
+@Metrics.timed("rank_lsa_seconds")
+def rank_lsa(
+            query: str,
+            n_grams: int,
+            k: int
+        ) -> tuple[list[tuple[str, float]], int]:
+    """
+    Given a user query, return an ordered list of (at most k) URLs ranked by
+    how similar their content is to the request in the latent semantic space
+    built at index time (see `lsa.LatentSemanticIndex`)
+
+    Unlike `rank`, this also finds pages that share no terms with the query
+    but talk about related concepts, and never fetches any pages
+
+    Parameters
+    ----------
+    query : str
+        The query provided by the user (this will be pre-processed and
+        corrected the same way as in `rank`)
+    n_grams : int
+        The upper-bound of n-grams to build from the query
+    k : int
+        The maximum number of URLs to return
+
+    Returns
+    -------
+    tuple[list[tuple[str, float]], int]
+        The ordered list of (at most k) URLs and their cosine similarities,
+        and the total number of URLs found
+    """
+    prelim_terms = correct_terms(preprocess_text(query))
+
+    query_terms = []
+    for curr_gram in range(1, n_grams + 1):
+        query_terms += get_grams(prelim_terms, curr_gram)
+
+    with Metrics.timer("lsa_scoring_seconds"):
+        return LatentSemanticIndex.get().search(query_terms, k)
+
+
+@Metrics.timed("rank_sharded_seconds")
+def rank_sharded(
+            query: str,
+            n_grams: int,
+            shards: list[str] | None = None,
+            k: int = MAX_SHARD_RESULTS,
+            documents_cache: dict[str, str] | None = None
+        ) -> tuple[list[tuple[str, float]], int]:
+    """
+    Given a user query, return an ordered list of (at most k) URLs ranked the
+    same way as `rank`, but fanning the query out across shards (see
+    `DBCon.get_department_index` and `DBCon.get_hash_index`) concurrently,
+    on workers shared by every query (see MAX_SHARD_WORKERS)
+
+    Scores are comparable across shards because IDF is calculated globally:
+    1. Every shard finds its candidates for the query and counts their terms
+    2. The document frequencies of every shard are summed into one IDF, and
+       the query vector is weighted with it
+    3. Every shard scores its candidates with that IDF and returns its top k,
+       which are merged into the overall top k
+
+    Which gives exactly the scores `rank` would give over one index holding
+    every shard's pages.
+
+    Parameters
+    ----------
+    query : str
+        The query provided by the user (this will be pre-processed and
+        corrected the same way as in `rank`)
+    n_grams : int
+        The upper-bound of n-grams to use for TF-IDF calculations
+    shards : list[str] | None, default=None
+        The shards to query (e.g. `[DBCon.get_department_index("bio")]` to
+        only search one department). Every published department shard if
+        None (see `DBCon.get_shards`). The shards must be of one
+        partitioning scheme (see `DBCon.get_shard_files_index`). Pages in
+        more than one of the shards are only counted (and returned) once
+    k : int, default=MAX_SHARD_RESULTS
+        The maximum number of URLs to return
+    documents_cache : dict[str, str] | None, default=None
+        An optional map of URL to its pre-processed document text
+        (see `rank`)
+
+    Returns
+    -------
+    tuple[list[tuple[str, float]], int]
+        The ordered list of (at most k) URLs and their cosine similarities,
+        and the total number of URLs found across every shard
+    """
+    if shards is None:
+        shards = DBCon.get_shards()
+    if not shards:
+        return [], 0
+
+    # Spelling is corrected with the index every shard shares
+    prelim_terms = correct_terms(
+        preprocess_text(query), DBCon.get_shard_files_index(shards)
+    )
+
+    query_terms = []
+    for curr_gram in range(1, n_grams + 1):
+        query_terms += get_grams(prelim_terms, curr_gram)
+
+    # Find every shard's candidates
+    candidates = list(SHARD_EXECUTOR.map(
+        lambda shard: find_shard_candidates(
+            shard, query_terms, n_grams, documents_cache
+        ),
+        shards
+    ))
+
+    # A page crawled from more than one department's seed is in more than
+    # one shard. Only the first shard keeps it, so it is counted only once
+    seen: set[str] = set()
+    for i, shard_candidates in enumerate(candidates):
+        rows = [
+            row for row, url in enumerate(shard_candidates['urls'])
+            if url not in seen
+        ]
+        seen.update(shard_candidates['urls'])
+        if len(rows) < len(shard_candidates['urls']):
+            candidates[i] = select_shard_candidates(shard_candidates, rows)
+
+    with Metrics.timer("scoring_seconds"):
+        # Calculate a global IDF. Like `rank`, the query counts as a document
+        analyzer = CountVectorizer(
+            stop_words='english', ngram_range=(1, n_grams)
+        ).build_analyzer()
+        query_counts = Counter(analyzer(' '.join(query_terms)))
+
+        doc_freqs: Counter[str] = Counter(query_counts.keys())
+        num_docs = 1
+        for shard_candidates in candidates:
+            num_docs += len(shard_candidates['urls'])
+            doc_freqs.update(dict(zip(
+                shard_candidates['features'],
+                shard_candidates['doc_freqs'].tolist()
+            )))
+
+        if num_docs == 1:
+            return [], 0
+
+        # Smoothed IDF, as calculated by TfidfVectorizer
+        idf = {
+            term: log((1 + num_docs) / (1 + doc_freq)) + 1
+            for term, doc_freq in doc_freqs.items()
+        }
+
+        q_weights = {
+            term: count * idf[term] for term, count in query_counts.items()
+        }
+        q_norm = sum(weight ** 2 for weight in q_weights.values()) ** 0.5
+        q_weights = {
+            term: weight / (q_norm or 1)
+            for term, weight in q_weights.items()
+        }
+
+        # Score every shard's candidates with it
+        rankings = list(SHARD_EXECUTOR.map(
+            lambda shard_candidates: score_shard_candidates(
+                shard_candidates, idf, q_weights, k
+            ),
+            candidates
+        ))
+
+    # Every candidate was found (like in `rank`), even if not in the top k
+    num_found = num_docs - 1
+
+    return heapq.nlargest(
+        k,
+        (result for ranking in rankings for result in ranking),
+        key=lambda x: x[1]
+    ), num_found
+
+
+def find_shard_candidates(
+            shard: str,
+            query_terms: list[str],
+            n_grams: int,
+            documents_cache: dict[str, str] | None = None
+        ) -> ShardCandidates:
+    """
+    Finds every document in a shard containing any of the query terms, and
+    counts the terms of each document
+
+    Parameters
+    ----------
+    shard : str
+        The name of the shard's index
+    query_terms : list[str]
+        The terms (every n-gram) of the query
+    n_grams : int
+        The upper-bound of n-grams to count
+    documents_cache : dict[str, str] | None, default=None
+        An optional map of URL to its pre-processed document text
+
+    Returns
+    -------
+    ShardCandidates
+        The candidates found and their term counts
+    """
+    urls = set()
+    for query_term in query_terms:
+        inverted_index = DBCon.get_inverted_index(query_term, shard)
+        urls.update(inverted_index['doc_list'])
+
+    ordered_urls = list(urls)
+    documents = [get_document(url, documents_cache) for url in ordered_urls]
+
+    if not documents:
+        return {
+            "urls": [],
+            "counts": csr_matrix((0, 0)),
+            "features": [],
+            "doc_freqs": np.zeros(0, dtype=np.int64)
+        }
+
+    vectorizer = CountVectorizer(
+        stop_words='english', ngram_range=(1, n_grams)
+    )
+    try:
+        counts = vectorizer.fit_transform(documents).tocsr()
+    except ValueError:
+        # Every document was empty (or only stop words)
+        counts = csr_matrix((len(documents), 0))
+        features: list[str] = []
+    else:
+        features = vectorizer.get_feature_names_out().tolist()
+
+    return {
+        "urls": ordered_urls,
+        "counts": counts,
+        "features": features,
+        # Every non-zero entry is one (document, term) pair
+        "doc_freqs": np.bincount(counts.indices, minlength=len(features))
+    }
+
+
+def select_shard_candidates(
+            candidates: ShardCandidates,
+            rows: list[int]
+        ) -> ShardCandidates:
+    """
+    Keeps only some of a shard's candidates, recounting the document
+    frequencies of their terms
+
+    Parameters
+    ----------
+    candidates : ShardCandidates
+        The shard's candidates
+    rows : list[int]
+        The indices of the candidates to keep
+
+    Returns
+    -------
+    ShardCandidates
+        The candidates kept
+    """
+    counts = candidates['counts'][rows]
+    features = candidates['features']
+
+    return {
+        "urls": [candidates['urls'][row] for row in rows],
+        "counts": counts,
+        "features": features,
+        "doc_freqs": np.bincount(counts.indices, minlength=len(features))
+    }
+
+
+def score_shard_candidates(
+            candidates: ShardCandidates,
+            idf: dict[str, float],
+            q_weights: dict[str, float],
+            k: int
+        ) -> list[tuple[str, float]]:
+    """
+    Scores a shard's candidates by the cosine similarity of their TF-IDF
+    vectors (weighted by the global IDF) to the query's
+
+    Parameters
+    ----------
+    candidates : ShardCandidates
+        The shard's candidates
+    idf : dict[str, float]
+        The global IDF of every term
+    q_weights : dict[str, float]
+        The (unit-length) TF-IDF vector of the query, by term
+    k : int
+        The maximum number of URLs to return
+
+    Returns
+    -------
+    list[tuple[str, float]]
+        The shard's top k URLs and their cosine similarities, best first
+    """
+    urls = candidates['urls']
+    if not urls or not candidates['features']:
+        return []
+
+    features = candidates['features']
+    idf_vector = np.array([idf[term] for term in features])
+    q_vector = np.array([q_weights.get(term, 0.0) for term in features])
+
+    tf_idf_mat = normalize(candidates['counts'].multiply(idf_vector).tocsr())
+    similarity = tf_idf_mat @ q_vector
+
+    k = min(k, len(urls))
+    top = np.argpartition(-similarity, k - 1)[:k]
+    top = top[np.argsort(-similarity[top], kind="stable")]
+
+    return [(urls[i], float(similarity[i])) for i in top]
+
+
+def correct_terms(terms: list[str], index: str | None = None) -> list[str]:
+    """
+    Corrects every misspelled term to the closest indexed word (within
+    `SpellingIndex.max_distance` edits, which depends on its length)
+
+    Parameters
+    ----------
+    terms : list[str]
+        The pre-processed terms of a query
+    index : str | None, default=None
+        The name of the index whose spelling index to use (e.g. the one
+        shared by shards, see `DBCon.get_shard_files_index`). The unsharded
+        index if None
+
+    Returns
+    -------
+    list[str]
+        The corrected terms. Terms that were indexed, or that are not close
+        to any indexed word, are left as they are
+    """
+    spelling = SpellingIndex.get(index)
+
+    corrected = [spelling.correct(term) for term in terms]
+    Metrics.inc(
+        "query_terms_corrected_total",
+        sum(a != b for a, b in zip(terms, corrected))
+    )
+
+    return corrected
+
+
+def autocomplete(
+            prefix: str,
+            n_results: int = 5,
+            index: str | None = None
+        ) -> list[tuple[str, int]]:
+    """
+    Completes a partially typed query using every term indexed, ranking the
+    completions by the number of documents they occur in
+
+    Parameters
+    ----------
+    prefix : str
+        The partially typed query
+    n_results : int, default=5
+        The maximum number of completions to return
+    index : str | None, default=None
+        The name of the index whose vocabulary to use (e.g. the one shared
+        by shards, see `DBCon.get_shard_files_index`). The unsharded index
+        if None
+
+    Returns
+    -------
+    list[tuple[str, int]]
+        The completed terms and the number of documents they occur in,
+        best first
+    """
+    prefix = ' '.join(prefix.lower().split())
+    return Vocabulary.get(index).complete(prefix, n_results)
+
+
+def get_document(
+            url: str,
+            documents_cache: dict[str, str] | None = None
+        ) -> str:
+    """
+    Retrieves the pre-processed text content of the page at a given URL
+
+    Parameters
+    ----------
+    url : str
+        The URL of the page to retrieve
+    documents_cache : dict[str, str] | None, default=None
+        An optional map of URL to pre-processed text. If the URL is cached,
+        no DB call is made, otherwise the result is added to the cache
+
+    Returns
+    -------
+    str
+        The pre-processed text of the page, as space-separated tokens
+    """
+    if documents_cache is not None and url in documents_cache:
+        return documents_cache[url]
+
+    page = DBCon.get_page(url)
+    document = ' '.join(preprocess_text(page['html']))
+
+    if documents_cache is not None:
+        documents_cache[url] = document
+
+    return document
+
+
 def paginate(
             ranking: list[tuple[str, float]],
             results_per: int
@@ -116,7 +573,12 @@ def paginate(
     return pages
 
 
-def query_user(n_results: int, n_grams: int) -> None:
+def query_user(
+            n_results: int,
+            n_grams: int,
+            use_lsa: bool = False,
+            shards: list[str] | None = None
+        ) -> None:
     """
     Infinitely queries the user until the user quits. Each query will be met
     with at most n_results results
@@ -127,7 +589,21 @@ def query_user(n_results: int, n_grams: int) -> None:
         The maximum number of results to retrieve
     n_grams : int
         The number of grams to pass to the TF-IDF function eventually
+    use_lsa : bool, default=False
+        Whether to rank with the latent semantic index (`rank_lsa`) instead
+        of TF-IDF over the pages found for each term (`rank`)
+    shards : list[str] | None, default=None
+        If given, rank across these shards with `rank_sharded` instead, and
+        autocomplete with the vocabulary they share. An empty list means
+        every published department shard. Can't be combined with use_lsa
     """
+    if use_lsa and shards is not None:
+        raise ValueError("Shards can't be searched with LSA.")
+
+    # The vocabulary to autocomplete with
+    index = None
+    if shards is not None:
+        index = DBCon.get_shard_files_index(shards)
 
     paginated_ranking: list[list[tuple[str, float]]] = []
     curr_page: int = 0
@@ -137,13 +613,24 @@ def query_user(n_results: int, n_grams: int) -> None:
         user_query = input(
             "Search Faculty Crawler " +
             "('-q' to quit, '-next' to go to the next page, " +
-            "'-prev' to go to the previous page): "
+            "'-prev' to go to the previous page, " +
+            "'-c <prefix>' to autocomplete): "
         )
 
         # The user herby quits
         if user_query == "-q":
             break
 
+        # Autocompletion
+        if user_query.startswith("-c "):
+            completions = autocomplete(user_query[3:], n_results, index)
+            if not completions:
+                print("No completions found!")
+            for ind, (term, doc_freq) in enumerate(completions):
+                print(f"{ind + 1}) {term} ({doc_freq} documents)")
+            print()
+            continue
+
         # Scrolling pages
         if user_query == "-next":
             curr_page += 1
@@ -152,9 +639,15 @@ def query_user(n_results: int, n_grams: int) -> None:
         # Retrieve the paginated and ranked results
         else:
             start = time()
-            paginated_ranking = paginate(
-                rank(user_query, n_grams), n_results
-            )
+            if use_lsa:
+                ranked, _ = rank_lsa(user_query, n_grams, MAX_LSA_RESULTS)
+            elif shards is not None:
+                ranked, _ = rank_sharded(
+                    user_query, n_grams, shards or None
+                )
+            else:
+                ranked = rank(user_query, n_grams)
+            paginated_ranking = paginate(ranked, n_results)
             curr_page = 0
 
             if paginated_ranking:
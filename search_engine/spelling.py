@@ -0,0 +1,346 @@
+import json
+import os
+from array import array
+from itertools import combinations
+
+from .index_files import IndexFile
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Calculates the (optimal string alignment) Damerau-Levenshtein distance
+    between two strings: the number of insertions, deletions, substitutions,
+    and transpositions of adjacent characters needed to turn one into the
+    other
+
+    Only the diagonal band of cells within max_distance of the main diagonal
+    is calculated (cells outside it are always further than max_distance),
+    after dropping the prefix and suffix both strings share
+
+    Parameters
+    ----------
+    a : str
+        The first string
+    b : str
+        The second string
+    max_distance : int
+        The largest distance we care about. Calculation stops early once the
+        distance is known to be larger
+
+    Returns
+    -------
+    int
+        The distance, or max_distance + 1 if it is larger than max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    # Shared prefixes and suffixes never cost anything
+    start = 0
+    while start < len(a) and start < len(b) and a[start] == b[start]:
+        start += 1
+    a_end, b_end = len(a), len(b)
+    while a_end > start and b_end > start and a[a_end - 1] == b[b_end - 1]:
+        a_end -= 1
+        b_end -= 1
+    a, b = a[start:a_end], b[start:b_end]
+
+    if not a or not b:
+        return min(max(len(a), len(b)), max_distance + 1)
+
+    # Cells outside the band are treated as already too far
+    too_far = max_distance + 1
+    previous2: list[int] = []
+    previous = [j if j <= max_distance else too_far for j in range(len(b) + 1)]
+
+    for i in range(1, len(a) + 1):
+        current = [too_far] * (len(b) + 1)
+        current[0] = i if i <= max_distance else too_far
+        lo = max(1, i - max_distance)
+        hi = min(len(b), i + max_distance)
+
+        for j in range(lo, hi + 1):
+            cost = a[i - 1] != b[j - 1]
+            value = min(
+                previous[j] + 1,         # Deletion
+                current[j - 1] + 1,      # Insertion
+                previous[j - 1] + cost   # Substitution
+            )
+            if (
+                i > 1 and j > 1 and
+                a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]
+            ):
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+
+        if min(current[lo - 1:hi + 1]) > max_distance:
+            return too_far
+
+        previous2, previous = previous, current
+
+    return min(previous[-1], too_far)
+
+
+def get_deletes(word: str, max_distance: int) -> set[str]:
+    """
+    Retrieves every string made by deleting up to max_distance characters
+    from a word (including the word itself)
+
+    Parameters
+    ----------
+    word : str
+        The word to delete characters from
+    max_distance : int
+        The most characters to delete
+
+    Returns
+    -------
+    set[str]
+        Every string found
+    """
+    deletes = {word}
+    for distance in range(1, min(max_distance, len(word)) + 1):
+        for removed in combinations(range(len(word)), distance):
+            deletes.add(''.join(
+                char for i, char in enumerate(word) if i not in removed
+            ))
+
+    return deletes
+
+
+class SpellingIndex(IndexFile):
+    """
+    A symmetric-delete (SymSpell) index over every single-word term in the
+    vocabulary, used to correct misspelled query terms (n-grams are left out,
+    since query n-grams are built from corrected words)
+
+    Every string made by deleting up to MAX_DISTANCE characters from the
+    first PREFIX_LENGTH characters of a term maps back to that term. Two
+    words are within MAX_DISTANCE edits of each other only if they share such
+    a delete, so correcting a word only needs a dictionary lookup for each of
+    its own deletes (and an edit distance check of each term found) rather
+    than a scan over the whole vocabulary
+    """
+
+    # The spelling index built at index time is stored alongside the other
+    # files of the same index version (see `IndexFile.path()`)
+    FILENAME = "spelling.json"
+
+    # The most edits a correction can be from the original word. Shorter
+    # words are allowed fewer (see `max_distance()`), since a couple of edits
+    # turn most short words into some other valid word ("dna" into "data")
+    MAX_DISTANCE = 2
+    # The longest words allowed no edits, and one edit, respectively
+    EXACT_LENGTH = 3
+    ONE_EDIT_LENGTH = 5
+    # Only this many leading characters of a word are used to find
+    # candidates, which keeps the number of deletes per word small
+    PREFIX_LENGTH = 7
+
+    def __init__(
+                self,
+                terms: list[str],
+                doc_freqs: list[int],
+                deletes: dict[str, list[int]] | None = None
+            ) -> None:
+        """
+        Parameters
+        ----------
+        terms : list[str]
+            Every term that queries can be corrected to
+        doc_freqs : list[int]
+            The number of documents each term occurs in, such that
+            doc_freqs[i] belongs to terms[i]
+        deletes : dict[str, list[int]] | None, default=None
+            A map of each delete to the indices of the terms it came from.
+            Calculated from terms if None
+        """
+        self.terms = terms
+        self.doc_freqs = array("I", doc_freqs)
+        self.term_indices = {term: i for i, term in enumerate(terms)}
+
+        if deletes is None:
+            deletes = {}
+            for i, term in enumerate(terms):
+                for delete in get_deletes(
+                            term[:SpellingIndex.PREFIX_LENGTH],
+                            SpellingIndex.MAX_DISTANCE
+                        ):
+                    deletes.setdefault(delete, []).append(i)
+
+        self.deletes = deletes
+
+    @staticmethod
+    def empty() -> "SpellingIndex":
+        """
+        Retrieves a spelling index with no terms
+
+        Returns
+        -------
+        SpellingIndex
+            The empty spelling index
+        """
+        return SpellingIndex([], [])
+
+    def save(self, path: str) -> None:
+        """
+        Saves the spelling index to a JSON file
+
+        Parameters
+        ----------
+        path : str
+            The file to save to
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump({
+                "terms": self.terms,
+                "doc_freqs": self.doc_freqs.tolist(),
+                "deletes": self.deletes
+            }, file)
+
+    @staticmethod
+    def load(path: str) -> "SpellingIndex":
+        """
+        Loads a spelling index saved with `save()`
+
+        Parameters
+        ----------
+        path : str
+            The file to load from
+
+        Returns
+        -------
+        SpellingIndex
+            The loaded spelling index
+        """
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+
+        return SpellingIndex(data["terms"], data["doc_freqs"], data["deletes"])
+
+    @staticmethod
+    def max_distance(word: str) -> int:
+        """
+        Retrieves the most edits a correction of a word may be from it: none
+        for words of up to EXACT_LENGTH characters, one for words of up to
+        ONE_EDIT_LENGTH characters, and MAX_DISTANCE otherwise
+
+        Parameters
+        ----------
+        word : str
+            The word to correct
+
+        Returns
+        -------
+        int
+            The most edits allowed
+        """
+        if len(word) <= SpellingIndex.EXACT_LENGTH:
+            return 0
+        if len(word) <= SpellingIndex.ONE_EDIT_LENGTH:
+            return 1
+        return SpellingIndex.MAX_DISTANCE
+
+    def _candidates(self, word: str, max_distance: int) -> set[int]:
+        """
+        Retrieves the indices of every term sharing a delete with word, which
+        includes every term within max_distance edits of it
+
+        Parameters
+        ----------
+        word : str
+            The word to find candidates for
+        max_distance : int
+            The most edits allowed
+
+        Returns
+        -------
+        set[int]
+            The indices of the candidate terms
+        """
+        candidates: set[int] = set()
+        if max_distance == 0:
+            return candidates
+
+        # Terms were indexed with up to MAX_DISTANCE deletes, so the word
+        # only needs as many as it is allowed edits
+        for delete in get_deletes(
+                    word[:SpellingIndex.PREFIX_LENGTH], max_distance
+                ):
+            candidates.update(self.deletes.get(delete, ()))
+
+        return candidates
+
+    def lookup(self, word: str) -> list[tuple[str, int]]:
+        """
+        Retrieves every term within `max_distance(word)` edits of a word
+
+        Parameters
+        ----------
+        word : str
+            The (possibly misspelled) word to look up
+
+        Returns
+        -------
+        list[tuple[str, int]]
+            Every term found and its distance from word, closest first (and
+            then most documents first)
+        """
+        if word in self.term_indices:
+            return [(word, 0)]
+
+        max_distance = SpellingIndex.max_distance(word)
+
+        matches: list[tuple[int, int]] = []
+        for i in self._candidates(word, max_distance):
+            distance = edit_distance(word, self.terms[i], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, i))
+
+        matches.sort(key=lambda x: (x[0], -self.doc_freqs[x[1]], x[1]))
+        return [(self.terms[i], distance) for distance, i in matches]
+
+    def correct(self, word: str) -> str:
+        """
+        Corrects a word to the closest term (or, of those equally close, the
+        one occurring in the most documents)
+
+        Parameters
+        ----------
+        word : str
+            The (possibly misspelled) word to correct
+
+        Returns
+        -------
+        str
+            The correction, or word itself if it is already a term or no
+            term is close enough
+        """
+        if word in self.term_indices:
+            return word
+
+        # Only the closest terms matter, so every match found narrows down
+        # how far the rest of the candidates may be. Candidates closest in
+        # length are checked first, as they are the likeliest to be close
+        max_distance = SpellingIndex.max_distance(word)
+        candidates = sorted(
+            self._candidates(word, max_distance),
+            key=lambda i: abs(len(self.terms[i]) - len(word))
+        )
+
+        best: tuple[int, int, int] | None = None
+        for i in candidates:
+            if abs(len(self.terms[i]) - len(word)) > max_distance:
+                break
+
+            distance = edit_distance(word, self.terms[i], max_distance)
+            if distance > max_distance:
+                continue
+
+            match = (distance, -self.doc_freqs[i], i)
+            if best is None or match < best:
+                best = match
+                max_distance = distance
+
+        return self.terms[best[2]] if best is not None else word
@@ -0,0 +1,289 @@
+import heapq
+import json
+import os
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator
+
+from .index_files import IndexFile
+
+
+class Vocabulary(IndexFile):
+    """
+    Every indexed term (including n-grams) alongside its document frequency,
+    kept as a sorted array so that every term sharing a prefix can be found
+    with two binary searches
+
+    This is built when indexing and is used for search-as-you-type
+    completions (see `complete`)
+    """
+
+    # The vocabulary built at index time is stored alongside the other files
+    # of the same index version (see `IndexFile.path()`)
+    FILENAME = "vocabulary.jsonl"
+
+    # The most completions that are precomputed for a prefix
+    MAX_COMPLETIONS = 10
+    # Prefixes matching more terms than this have their completions
+    # precomputed, so no lookup ever has to scan more than this many terms
+    PRECOMPUTE_THRESHOLD = 64
+
+    def __init__(self, terms: list[str], doc_freqs: list[int]) -> None:
+        """
+        Parameters
+        ----------
+        terms : list[str]
+            Every term, sorted
+        doc_freqs : list[int]
+            The number of documents each term occurs in, such that
+            doc_freqs[i] belongs to terms[i]
+        """
+        self.terms = terms
+        self.doc_freqs = array("I", doc_freqs)
+
+        # Prefix -> indices of its top MAX_COMPLETIONS completions
+        self.top_completions: dict[str, list[int]] = {}
+        self._precompute()
+
+    @staticmethod
+    def empty() -> "Vocabulary":
+        """
+        Retrieves a vocabulary with no terms
+
+        Returns
+        -------
+        Vocabulary
+            The empty vocabulary
+        """
+        return Vocabulary([], [])
+
+    def save(self, path: str) -> None:
+        """
+        Saves the vocabulary to a file (see `write_entries()`)
+
+        Parameters
+        ----------
+        path : str
+            The file to save to
+        """
+        Vocabulary.write_entries(path, zip(self.terms, self.doc_freqs))
+
+    @staticmethod
+    def write_entries(path: str, entries: Iterable[tuple[str, int]]) -> int:
+        """
+        Writes a vocabulary to a file of JSON lines, one term at a time:
+        `["cats love", 3]`. The entries are streamed, so a vocabulary can be
+        written while it is being built without ever being held in memory
+
+        Parameters
+        ----------
+        path : str
+            The file to write to
+        entries : Iterable[tuple[str, int]]
+            Every term (sorted) and the number of documents it occurs in
+
+        Returns
+        -------
+        int
+            The number of terms written
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        num_terms = 0
+        with open(path, "w", encoding="utf-8") as file:
+            for term, doc_freq in entries:
+                file.write(json.dumps([term, doc_freq]) + "\n")
+                num_terms += 1
+
+        return num_terms
+
+    @staticmethod
+    def read_entries(path: str) -> Iterator[tuple[str, int]]:
+        """
+        Reads back a vocabulary written by `write_entries()`, one term at a
+        time
+
+        Parameters
+        ----------
+        path : str
+            The file to read
+
+        Yields
+        ------
+        tuple[str, int]
+            Each term and the number of documents it occurs in, in order of
+            term
+        """
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                term, doc_freq = json.loads(line)
+                yield term, doc_freq
+
+    @staticmethod
+    def load(path: str) -> "Vocabulary":
+        """
+        Loads a vocabulary saved with `save()`
+
+        Parameters
+        ----------
+        path : str
+            The file to load from
+
+        Returns
+        -------
+        Vocabulary
+            The loaded vocabulary
+        """
+        terms: list[str] = []
+        doc_freqs: list[int] = []
+        for term, doc_freq in Vocabulary.read_entries(path):
+            terms.append(term)
+            doc_freqs.append(doc_freq)
+
+        return Vocabulary(terms, doc_freqs)
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def __contains__(self, term: str) -> bool:
+        index = bisect_left(self.terms, term)
+        return index < len(self.terms) and self.terms[index] == term
+
+    def doc_freq(self, term: str) -> int:
+        """
+        Retrieves the number of documents a term occurs in
+
+        Parameters
+        ----------
+        term : str
+            The term to look up
+
+        Returns
+        -------
+        int
+            The document frequency of the term, or 0 if it was never indexed
+        """
+        index = bisect_left(self.terms, term)
+        if index < len(self.terms) and self.terms[index] == term:
+            return self.doc_freqs[index]
+        return 0
+
+    def prefix_range(
+                self,
+                prefix: str,
+                lo: int = 0,
+                hi: int | None = None
+            ) -> tuple[int, int]:
+        """
+        Retrieves the range of indices of every term starting with prefix
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix to search for
+        lo : int, default=0
+            The first index to search from
+        hi : int | None, default=None
+            The index to search up to (the end of the terms if None)
+
+        Returns
+        -------
+        tuple[int, int]
+            The start (inclusive) and end (exclusive) of the range
+        """
+        hi = len(self.terms) if hi is None else hi
+        start = bisect_left(self.terms, prefix, lo, hi)
+        if not prefix:
+            return start, hi
+
+        # The smallest string greater than every string starting with prefix
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return start, bisect_left(self.terms, upper, start, hi)
+
+    def _top(self, start: int, end: int, k: int) -> list[int]:
+        """
+        Retrieves the indices of the k terms in a range occurring in the most
+        documents, breaking ties alphabetically
+
+        Parameters
+        ----------
+        start : int
+            The start of the range (inclusive)
+        end : int
+            The end of the range (exclusive)
+        k : int
+            The number of indices to retrieve
+
+        Returns
+        -------
+        list[int]
+            The top k indices, best first
+        """
+        return heapq.nlargest(
+            k, range(start, end), key=lambda i: (self.doc_freqs[i], -i)
+        )
+
+    def _precompute(self) -> None:
+        """
+        Precomputes the top completions of every prefix matching more than
+        PRECOMPUTE_THRESHOLD terms. Prefixes are only extended while they
+        still match that many terms, so this is roughly linear in the size of
+        the vocabulary
+        """
+        ranges = [(0, len(self.terms))]
+        length = 1
+
+        if len(self.terms) > Vocabulary.PRECOMPUTE_THRESHOLD:
+            self.top_completions[""] = self._top(
+                0, len(self.terms), Vocabulary.MAX_COMPLETIONS
+            )
+
+        while ranges:
+            next_ranges: list[tuple[int, int]] = []
+
+            for lo, hi in ranges:
+                start = lo
+                while start < hi:
+                    # Terms shorter than this prefix length are already
+                    # covered by a shorter prefix
+                    if len(self.terms[start]) < length:
+                        start += 1
+                        continue
+
+                    prefix = self.terms[start][:length]
+                    _, end = self.prefix_range(prefix, start, hi)
+
+                    if end - start > Vocabulary.PRECOMPUTE_THRESHOLD:
+                        self.top_completions[prefix] = self._top(
+                            start, end, Vocabulary.MAX_COMPLETIONS
+                        )
+                        next_ranges.append((start, end))
+
+                    start = end
+
+            ranges = next_ranges
+            length += 1
+
+    def complete(self, prefix: str, k: int = 5) -> list[tuple[str, int]]:
+        """
+        Retrieves the k terms starting with prefix that occur in the most
+        documents
+
+        Parameters
+        ----------
+        prefix : str
+            The prefix to complete
+        k : int, default=5
+            The maximum number of completions to retrieve
+
+        Returns
+        -------
+        list[tuple[str, int]]
+            The completions and their document frequencies, best first
+        """
+        if prefix in self.top_completions and k <= Vocabulary.MAX_COMPLETIONS:
+            indices = self.top_completions[prefix][:k]
+        else:
+            indices = self._top(*self.prefix_range(prefix), k)
+
+        return [(self.terms[i], self.doc_freqs[i]) for i in indices]